@@ -0,0 +1,435 @@
+# benchmarks/mock_servers.py
+
+import base64
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, unquote, urlparse
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+MOCK_POST_TEXT = (
+    "🔪 Встречайте новую коллекцию ножей ZeroKnifes! Острые, надёжные и красивые — "
+    "готовить станет настоящим удовольствием. #ZeroKnifes #кухня"
+)
+MOCK_IMAGE_PROMPT = (
+    "photo of a sleek modern chef knife on dark granite, cinematic lighting, ultra-realistic, 8k"
+)
+
+
+def _make_png(size: int = 64) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), (200, 60, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+MOCK_IMAGE = _make_png()
+
+
+@dataclass
+class MockBehavior:
+    """
+    Поведение заглушек: задержка ответа, доля ошибок и доля ответов 429.
+    """
+    latency: float = 0.05
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+
+
+class _Server(ThreadingHTTPServer):
+    # Очередь по умолчанию (5) переполняется, когда асинхронный клиент открывает много соединений разом
+    request_queue_size = 128
+
+
+class MockServer:
+    """
+    Локальный HTTP-сервер, имитирующий DeepSeek, Vertex AI, GCS и VK API.
+
+    Поддерживаемые маршруты:
+        POST /chat/completions                 — OpenAI-совместимый API DeepSeek
+        POST /.../models/<model>:generateContent — Gemini (REST Vertex AI)
+        POST /.../models/<model>:predict         — Imagen (REST Vertex AI)
+        GET  /.../publishers/google/models/<model> — метаданные модели Model Garden
+        POST /upload/storage/v1/b/<bucket>/o   — загрузка объекта в GCS
+        GET  /storage/v1/b/<bucket>/o          — список объектов GCS
+        GET  /download/storage/v1/b/<bucket>/o/<name> — скачивание объекта GCS
+        POST/GET /.../batchPredictionJobs[/<id>] — пакетные задания Gemini
+        POST /token                            — выдача OAuth-токена
+        GET/POST /method/<name>                — методы VK API
+        POST /vk-upload                        — сервер загрузки фото VK
+    """
+
+    def __init__(self, behavior: MockBehavior | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.behavior = behavior or MockBehavior()
+        self.requests = Counter()
+        # Объекты GCS: (бакет, имя) -> содержимое; пакетные задания: id -> ресурс
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.batch_jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Заглушки запущены на {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] += 1
+
+    def simulate(self) -> str | None:
+        """
+        Выдерживает задержку и решает, нужно ли вернуть ошибку ('error' или 'rate_limit').
+        """
+        behavior = self.behavior
+        delay = behavior.latency + random.uniform(0, behavior.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        roll = random.random()
+        if roll < behavior.rate_limit_rate:
+            return "rate_limit"
+        if roll < behavior.rate_limit_rate + behavior.error_rate:
+            return "error"
+        return None
+
+
+def _make_handler(server: MockServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Заголовки и тело ответа пишутся отдельно: без TCP_NODELAY keep-alive запросы ждут delayed ACK (~40 мс)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch()
+
+        def do_POST(self):
+            self._dispatch()
+
+        def _read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send_json(self, payload, status: int = 200, headers: dict | None = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_failure(self, failure: str):
+            if failure == "rate_limit":
+                self._send_json(
+                    {"error": {"code": 429, "message": "Rate limit exceeded", "status": "RESOURCE_EXHAUSTED"}},
+                    status=429,
+                    headers={"Retry-After": str(server.behavior.retry_after)}
+                )
+            else:
+                self._send_json({"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}}, status=500)
+
+        def _dispatch(self):
+            parsed = urlparse(self.path)
+            path = parsed.path
+            body = self._read_body()
+
+            if path == "/token":
+                server.count("token")
+                self._send_json({"access_token": "mock-token", "expires_in": 3600, "token_type": "Bearer"})
+                return
+
+            if path.startswith("/method/"):
+                self._handle_vk(path[len("/method/"):], parsed, body)
+                return
+
+            if path == "/vk-upload":
+                server.count("vk.upload")
+                server.simulate()
+                self._send_json({"server": 1, "photo": "[{\"photo\":\"mock\"}]", "hash": "mockhash"})
+                return
+
+            if path.endswith("/chat/completions"):
+                route = "deepseek"
+            elif path.endswith(":generateContent"):
+                route = "gemini"
+            elif path.endswith(":predict"):
+                route = "imagen"
+            elif path.startswith("/upload/storage/"):
+                route = "gcs"
+            elif path.startswith("/download/storage/"):
+                route = "gcs_download"
+            elif path.startswith("/storage/v1/b/") and path.endswith("/o"):
+                route = "gcs_list"
+            elif "/batchPredictionJobs" in path:
+                route = "batch_prediction"
+            elif "/publishers/google/models/" in path:
+                route = "model_garden"
+            else:
+                server.count("unknown")
+                self._send_json({"error": {"code": 404, "message": f"Unknown route {path}"}}, status=404)
+                return
+
+            server.count(route)
+            failure = server.simulate() if route in ("deepseek", "gemini", "imagen", "gcs") else None
+            if failure:
+                self._send_failure(failure)
+                return
+
+            request = _parse_json(body) if route in ("deepseek", "gemini", "imagen", "batch_prediction") else {}
+            handler = getattr(self, f"_handle_{route}")
+            handler(path, parsed, request, body)
+
+        def _handle_deepseek(self, path, parsed, request, body):
+            messages = request.get("messages", [])
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            text = MOCK_IMAGE_PROMPT if "промпт" in json.dumps(messages, ensure_ascii=False) else MOCK_POST_TEXT
+            completion_tokens = len(text) // 4
+            self._send_json({
+                "id": "mock-completion",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "deepseek-chat"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            })
+
+        def _handle_gemini(self, path, parsed, request, body):
+            prompt = json.dumps(request, ensure_ascii=False)
+            text = MOCK_IMAGE_PROMPT if "промпт" in prompt else MOCK_POST_TEXT
+            self._send_json({
+                "candidates": [{
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP"
+                }],
+                "usageMetadata": {
+                    "promptTokenCount": len(prompt) // 4,
+                    "candidatesTokenCount": len(text) // 4,
+                    "totalTokenCount": (len(prompt) + len(text)) // 4
+                }
+            })
+
+        def _handle_imagen(self, path, parsed, request, body):
+            count = int((request.get("parameters") or {}).get("sampleCount", 1))
+            encoded = base64.b64encode(MOCK_IMAGE).decode("ascii")
+            self._send_json({
+                "predictions": [{"bytesBase64Encoded": encoded, "mimeType": "image/png"} for _ in range(count)]
+            })
+
+        def _handle_model_garden(self, path, parsed, request, body):
+            model = path.rsplit("/", 1)[-1]
+            self._send_json({
+                "name": f"publishers/google/models/{model}",
+                "versionId": model.split("@")[-1],
+                "openSourceCategory": "PROPRIETARY",
+                "launchStage": "GA",
+                "publisherModelTemplate": f"projects/{{project}}/locations/{{location}}/publishers/google/models/{model}",
+                "predictSchemata": {
+                    "instanceSchemaUri": "gs://google-cloud-aiplatform/schema/predict/instance/vision_generative_model_1.0.0.yaml",
+                    "parametersSchemaUri": "gs://google-cloud-aiplatform/schema/predict/params/vision_generative_model_1.0.0.yaml",
+                    "predictionSchemaUri": "gs://google-cloud-aiplatform/schema/predict/prediction/vision_generative_model_1.0.0.yaml"
+                }
+            })
+
+        def _handle_gcs(self, path, parsed, request, body):
+            bucket = path.split("/b/", 1)[1].split("/", 1)[0]
+            name = parse_qs(parsed.query).get("name", [None])[0]
+            if name is None:
+                match = re.search(rb'"name"\s*:\s*"([^"]+)"', body)
+                name = json.loads(b'"' + match.group(1) + b'"') if match else "object"
+            data = _multipart_media(body, self.headers.get("Content-Type", ""))
+            server.objects[(bucket, name)] = data
+            self._send_json(_gcs_resource(bucket, name, data))
+
+        def _handle_gcs_list(self, path, parsed, request, body):
+            bucket = path.split("/b/", 1)[1].split("/", 1)[0]
+            prefix = parse_qs(parsed.query).get("prefix", [""])[0]
+            items = [
+                _gcs_resource(bucket, name, data)
+                for (object_bucket, name), data in sorted(server.objects.items())
+                if object_bucket == bucket and name.startswith(prefix)
+            ]
+            self._send_json({"kind": "storage#objects", "items": items})
+
+        def _handle_gcs_download(self, path, parsed, request, body):
+            bucket, name = path.split("/b/", 1)[1].split("/o/", 1)
+            data = server.objects.get((bucket, unquote(name)))
+            if data is None:
+                self._send_json({"error": {"code": 404, "message": "No such object"}}, status=404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle_batch_prediction(self, path, parsed, request, body):
+            if self.command == "POST":
+                job_id = str(random.randint(10 ** 8, 10 ** 9))
+                job = dict(request, name=f"{path.strip('/').split('/', 1)[1]}/{job_id}", state="JOB_STATE_RUNNING")
+                server.batch_jobs[job_id] = job
+                threading.Thread(target=_run_batch_job, args=(server, job), daemon=True).start()
+                self._send_json(job)
+                return
+            job = server.batch_jobs.get(path.rsplit("/", 1)[-1])
+            if job is None:
+                self._send_json({"error": {"code": 404, "message": "No such job"}}, status=404)
+                return
+            self._send_json(job)
+
+        def _handle_vk(self, method, parsed, body):
+            server.count(f"vk.{method}")
+            failure = server.simulate()
+            if failure == "rate_limit":
+                self._send_json({"error": {"error_code": 6, "error_msg": "Too many requests per second"}})
+                return
+            if failure == "error":
+                self._send_json({"error": {"error_code": 10, "error_msg": "Internal server error"}})
+                return
+
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            if body:
+                params.update({key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()})
+            self._send_json({"response": _vk_response(method, params, server)})
+
+    return Handler
+
+
+def _vk_response(method: str, params: dict, server: MockServer):
+    if method == "execute":
+        results = []
+        code = params.get("code", "")
+        decoder = json.JSONDecoder()
+        for match in re.finditer(r"API\.([\w.]+)\(", code):
+            arguments, _ = decoder.raw_decode(code, match.end())
+            results.append(_vk_response(match.group(1), arguments, server))
+        return results
+    if method == "photos.getWallUploadServer":
+        return {"upload_url": f"{server.url}/vk-upload", "album_id": 1, "user_id": 1}
+    if method == "photos.saveWallPhoto":
+        return [{"id": random.randint(1, 10 ** 6), "owner_id": -int(params.get("group_id", 1))}]
+    if method == "wall.post":
+        return {"post_id": random.randint(1, 10 ** 6)}
+    if method == "stats.get":
+        start = int(float(params.get("timestamp_from", 0)))
+        days = int(params.get("intervals_count", 1))
+        return [
+            {
+                "period_from": start + day * 86400,
+                "period_to": start + (day + 1) * 86400,
+                "visitors": {"views": random.randint(100, 1000), "visitors": random.randint(10, 100)},
+                "reach": {"reach": random.randint(100, 5000)}
+            }
+            for day in range(days)
+        ]
+    if method == "groups.getMembers":
+        offset = int(params.get("offset", 0))
+        count = int(params.get("count", 1000))
+        total = 5000
+        return {"count": total, "items": list(range(offset + 1, min(total, offset + count) + 1))}
+    return {}
+
+
+def _run_batch_job(server: MockServer, job: dict) -> None:
+    """
+    Выполняет пакетное задание: читает входной JSONL из GCS и пишет ответы Gemini.
+    """
+    time.sleep(server.behavior.latency)
+    results = []
+    for uri in job["inputConfig"]["gcsSource"]["uris"]:
+        bucket, name = uri[len("gs://"):].split("/", 1)
+        for line in server.objects.get((bucket, name), b"").decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)["request"]
+            prompt = json.dumps(request, ensure_ascii=False)
+            text = MOCK_IMAGE_PROMPT if "промпт" in prompt else MOCK_POST_TEXT
+            results.append(json.dumps({
+                "status": "",
+                "processed_time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "request": request,
+                "response": {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                    "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4}
+                }
+            }, ensure_ascii=False))
+
+    prefix = job["outputConfig"]["gcsDestination"]["outputUriPrefix"].rstrip("/")
+    bucket, directory = prefix[len("gs://"):].split("/", 1)
+    directory = f"{directory}/prediction-model-{time.strftime('%Y-%m-%dT%H:%M:%S')}"
+    server.objects[(bucket, f"{directory}/predictions.jsonl")] = ("\n".join(results) + "\n").encode("utf-8")
+    job["outputInfo"] = {"gcsOutputDirectory": f"gs://{bucket}/{directory}"}
+    job["state"] = "JOB_STATE_SUCCEEDED"
+
+
+def _gcs_resource(bucket: str, name: str, data: bytes) -> dict:
+    return {
+        "kind": "storage#object",
+        "bucket": bucket,
+        "name": name,
+        "id": f"{bucket}/{name}/1",
+        "generation": "1",
+        "size": str(len(data)),
+        "contentType": "application/octet-stream"
+    }
+
+
+def _multipart_media(body: bytes, content_type: str) -> bytes:
+    """
+    Извлекает содержимое объекта из multipart/related-загрузки GCS.
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not content_type.startswith("multipart/") or not match:
+        return body
+    parts = body.split(b"--" + match.group(1).encode("ascii"))
+    if len(parts) < 3:
+        return body
+    data = parts[2].split(b"\r\n\r\n", 1)[-1]
+    return data[:-2] if data.endswith(b"\r\n") else data
+
+
+def _parse_json(body: bytes) -> dict:
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return {}
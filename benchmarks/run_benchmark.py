@@ -0,0 +1,303 @@
+# benchmarks/run_benchmark.py
+"""
+Офлайн-бенчмарк генераторов и клиентов VK на локальных заглушках.
+
+Запуск из корня проекта:
+    python -m benchmarks.run_benchmark --requests 100 --concurrency 16 --latency 0.2 --rate-limit-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import rsa
+import vertexai
+from google.api_core.client_options import ClientOptions
+from google.cloud import storage
+from google.oauth2 import service_account
+
+from benchmarks.mock_servers import MOCK_IMAGE, MockBehavior, MockServer
+from generators.image_gen_gg import ImagenGenerator
+from generators.text_gen_ds import DeepSeekPostGenerator
+from generators.text_gen_gg import GeminiPostGenerator
+from pipeline.post_pipeline import PostJob, PostPipeline
+from social_publishers.vk_publisher import AsyncVKPublisher, VKPublisher
+from social_stats.vk_stats import AsyncVKStats, VKStats
+from utils import metrics
+from utils.rate_limiter import PROVIDER_LIMITS, configure_limiter
+from utils.vk_async import AsyncVKClient
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = (
+    "deepseek", "gemini", "gemini_batch", "imagen", "coalesced", "vk_publish", "vk_stats", "vk_async", "pipeline"
+)
+TOPIC = "Новая коллекция кухонных ножей от компании ZeroKnifes"
+TONE = "позитивный и весёлый"
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Результаты одного сценария.
+    """
+    name: str
+    latencies: list[float] = field(default_factory=list)
+    failures: int = 0
+    duration: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.duration if self.duration else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+def make_credentials(token_uri: str) -> service_account.Credentials:
+    """
+    Создаёт сервисный аккаунт с одноразовым ключом: заглушка выдаёт токены,
+    а подпись signed URL выполняется локально.
+    """
+    _, private_key = rsa.newkeys(1024)
+    info = {
+        "type": "service_account",
+        "project_id": "mock-project",
+        "private_key_id": "mock",
+        "private_key": private_key.save_pkcs1().decode("ascii"),
+        "client_email": "benchmark@mock-project.iam.gserviceaccount.com",
+        "token_uri": token_uri
+    }
+    return service_account.Credentials.from_service_account_info(
+        info, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    )
+
+
+def run_scenario(name: str, operation, requests: int, concurrency: int) -> BenchmarkResult:
+    """
+    Выполняет операцию requests раз в пуле из concurrency потоков.
+    Операция получает номер запроса, чтобы запросы не совпадали друг с другом.
+    """
+    result = BenchmarkResult(name=name)
+
+    def timed(index: int):
+        started = time.perf_counter()
+        try:
+            ok = operation(index) is not None
+        except Exception as e:
+            logger.debug(f"{name}: {e}")
+            ok = False
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency in pool.map(timed, range(requests)):
+            if ok:
+                result.latencies.append(latency)
+            else:
+                result.failures += 1
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def run_pipeline(text_generator, image_generator, publisher, requests: int, concurrency: int) -> BenchmarkResult:
+    """
+    Прогоняет посты через PostPipeline. Задержка поста — длина критического пути по этапам.
+    """
+    result = BenchmarkResult(name="pipeline")
+    pipeline = PostPipeline(
+        text_generator, image_generator, publisher,
+        text_workers=concurrency, image_workers=max(1, concurrency // 2), publish_workers=max(1, concurrency // 2)
+    )
+
+    started = time.perf_counter()
+    posts = pipeline.run([PostJob(topic=f"{TOPIC} #{i}", tone=TONE) for i in range(requests)])
+    result.duration = time.perf_counter() - started
+
+    for post in posts:
+        if post.error:
+            result.failures += 1
+            continue
+        timings = post.timings
+        result.latencies.append(
+            max(timings["text"], timings["image_prompt"] + timings["image"]) + timings.get("publish", 0.0)
+        )
+    return result
+
+
+def run_gemini_batch(generator, requests: int) -> BenchmarkResult:
+    """
+    Генерирует посты одним пакетным заданием. Задержка поста — время до получения его результата.
+    """
+    result = BenchmarkResult(name="gemini_batch")
+    topics = [f"{TOPIC} #{i}" for i in range(requests)]
+
+    started = time.perf_counter()
+    for _, text in generator.generate_post_batch(topics, poll_interval=0.05, timeout=60):
+        if text is None:
+            result.failures += 1
+        else:
+            result.latencies.append(time.perf_counter() - started)
+    result.duration = time.perf_counter() - started
+    return result
+
+
+async def run_vk_async(api_url: str, requests: int, concurrency: int) -> BenchmarkResult:
+    """
+    Публикует посты с фото и читает статистику для нескольких сообществ в одном цикле событий.
+    """
+    result = BenchmarkResult(name="vk_async")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncVKClient(api_url) as client:
+        groups = [(AsyncVKPublisher("mock", group, client), AsyncVKStats("mock", group, client)) for group in range(1, 5)]
+
+        async def timed(index: int):
+            publisher, stats = groups[index % len(groups)]
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await asyncio.gather(
+                        publisher.publish_post("Тестовый пост", image=MOCK_IMAGE),
+                        stats.get_followers()
+                    )
+                except Exception as e:
+                    logger.debug(f"vk_async: {e}")
+                    result.failures += 1
+                    return
+                result.latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(i) for i in range(requests)))
+        result.duration = time.perf_counter() - started
+    return result
+
+
+def print_report(results: list[BenchmarkResult], behavior: MockBehavior) -> None:
+    print("\n" + "=" * 78)
+    print(
+        f"Заглушки: задержка {behavior.latency * 1000:.0f} мс (+{behavior.jitter * 1000:.0f} мс), "
+        f"ошибки {behavior.error_rate:.0%}, 429 {behavior.rate_limit_rate:.0%}"
+    )
+    print("=" * 78)
+    print(f"{'сценарий':<12}{'успешно':>9}{'ошибки':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'оп/сек':>10}")
+    for result in results:
+        print(
+            f"{result.name:<12}{len(result.latencies):>9}{result.failures:>8}"
+            f"{result.percentile(50) * 1000:>10.1f}{result.percentile(95) * 1000:>10.1f}"
+            f"{result.percentile(99) * 1000:>10.1f}{result.throughput:>10.2f}"
+        )
+    print("=" * 78)
+
+
+def main(argv=None) -> list[BenchmarkResult]:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк генерации и публикации постов")
+    parser.add_argument("--requests", type=int, default=50, help="Число операций на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8, help="Число параллельных потоков")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа заглушек, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429 / VK error 6")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Значение заголовка Retry-After, сек")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Не снимать клиентские лимиты частоты запросов")
+    parser.add_argument("--metrics", action="store_true", help="Собрать и вывести метрики в формате Prometheus")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    if args.metrics:
+        metrics.enable()
+    if not args.keep_rate_limits:
+        for provider in PROVIDER_LIMITS:
+            configure_limiter(provider, rate=1e6, capacity=1e6)
+
+    behavior = MockBehavior(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after
+    )
+
+    workdir = tempfile.mkdtemp(prefix="postgen-bench-")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)  # generated_images/ создаётся во временном каталоге
+
+    try:
+        with MockServer(behavior) as server:
+            credentials = make_credentials(f"{server.url}/token")
+            vertexai.init(
+                project="mock-project",
+                location="us-central1",
+                credentials=credentials,
+                api_endpoint=server.url,
+                api_transport="rest"
+            )
+            storage_client = storage.Client(
+                project="mock-project",
+                credentials=credentials,
+                client_options=ClientOptions(api_endpoint=server.url)
+            )
+
+            deepseek = DeepSeekPostGenerator(api_key="mock", tone=TONE, topic=TOPIC, base_url=server.url)
+            gemini = GeminiPostGenerator(
+                "mock-project", "us-central1", tone=TONE, topic=TOPIC,
+                gcs_bucket_name="mock-bucket", storage_client=storage_client
+            )
+            imagen = ImagenGenerator(
+                "mock-project", "us-central1", "mock-bucket",
+                streaming_io=True, storage_client=storage_client
+            )
+            publisher = VKPublisher("mock", 1, api_url=f"{server.url}/method")
+            stats = VKStats("mock", 1, api_url=f"{server.url}/method")
+
+            operations = {
+                "deepseek": lambda i: deepseek.generate_post(f"{TOPIC} #{i}"),
+                "gemini": lambda i: gemini.generate_post(f"{TOPIC} #{i}"),
+                "imagen": lambda i: imagen.generate_image(f"photo of a chef knife #{i}"),
+                # Одна и та же тема во всех запросах: одновременные вызовы объединяются в один
+                "coalesced": lambda i: gemini.generate_post(TOPIC),
+                "vk_publish": lambda i: publisher.publish_post("Тестовый пост", image=MOCK_IMAGE),
+                "vk_stats": lambda i: stats.get_stats("2025-01-01", "2025-01-31"),
+            }
+
+            results = []
+            for name in scenarios:
+                if name == "pipeline":
+                    result = run_pipeline(deepseek, imagen, publisher, args.requests, args.concurrency)
+                elif name == "gemini_batch":
+                    result = run_gemini_batch(gemini, args.requests)
+                elif name == "vk_async":
+                    result = asyncio.run(run_vk_async(f"{server.url}/method", args.requests, args.concurrency))
+                else:
+                    result = run_scenario(name, operations[name], args.requests, args.concurrency)
+                results.append(result)
+
+            print_report(results, behavior)
+            print(f"Запросов к заглушкам: {dict(server.requests)}")
+            if args.metrics:
+                print(metrics.render_prometheus())
+            return results
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# generators/batch.py
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+async def run_concurrently(func: Callable[..., Any], jobs: Iterable[tuple], concurrency: int = 8) -> list:
+    """
+    Выполняет блокирующую функцию для каждого набора аргументов параллельно.
+
+    Вызовы выполняются в отдельном пуле потоков, одновременно работает не более
+    `concurrency` запросов. Результаты возвращаются в порядке входных заданий,
+    ошибка отдельного задания превращается в None и не прерывает пакет.
+
+    Args:
+        func (Callable): Блокирующая функция (например, генерация одного поста)
+        jobs (Iterable[tuple]): Аргументы для каждого вызова
+        concurrency (int): Максимальное число одновременных вызовов
+
+    Returns:
+        list: Результаты в порядке заданий
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency должен быть не меньше 1")
+
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(jobs))) as executor:
+        async def run_one(index: int, args: tuple):
+            async with semaphore:
+                try:
+                    return await loop.run_in_executor(executor, func, *args)
+                except Exception as e:
+                    logger.error(f"Ошибка в задании #{index}: {e}")
+                    return None
+
+        return await asyncio.gather(*(run_one(i, args) for i, args in enumerate(jobs)))
+
+
+def map_concurrently(func: Callable[..., Any], jobs: Iterable[tuple], concurrency: int = 8) -> list:
+    """
+    Синхронный вариант run_concurrently для кода без цикла событий.
+
+    Семантика та же: порядок результатов совпадает с порядком заданий,
+    ошибка отдельного задания превращается в None.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency должен быть не меньше 1")
+
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    def run_one(index: int, args: tuple):
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"Ошибка в задании #{index}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(jobs))) as executor:
+        return list(executor.map(run_one, range(len(jobs)), jobs))
+
+
+def post_jobs(topics: Iterable[str], tones: str | Iterable[str] | None, default_tone: str) -> list[tuple[str, str]]:
+    """
+    Собирает пары (тема, тон): один тон на все темы или по тону на каждую.
+    """
+    topics = list(topics)
+    if tones is None or isinstance(tones, str):
+        return [(topic, tones or default_tone) for topic in topics]
+    tones = list(tones)
+    if len(tones) != len(topics):
+        raise ValueError(f"Число тонов ({len(tones)}) не совпадает с числом тем ({len(topics)})")
+    return list(zip(topics, tones))
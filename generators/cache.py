@@ -0,0 +1,145 @@
+# generators/cache.py
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Кэш ответов текстовых моделей с адресацией по содержимому запроса.
+
+    Первый уровень — LRU в памяти, второй (необязательный) — SQLite на диске.
+    Записи старше `ttl` секунд считаются устаревшими на обоих уровнях.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None, db_path: str | None = None):
+        """
+        Инициализация кэша.
+
+        Args:
+            max_entries (int): Максимальное число записей в памяти
+            ttl (float | None): Время жизни записи в секундах (None — бессрочно)
+            db_path (str | None): Путь к файлу SQLite для дискового уровня
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"Дисковый кэш ответов: {db_path}")
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+        """
+        Формирует ключ кэша как хэш всех параметров запроса.
+        """
+        payload = json.dumps(
+            [model, system_prompt, user_prompt, temperature],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> str | None:
+        """
+        Возвращает сохранённый ответ или None, если его нет либо он устарел.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc("postgen_cache_requests_total", result="hit", tier="memory")
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at):
+                        self._remember(key, value, created_at)
+                        self.hits += 1
+                        metrics.inc("postgen_cache_requests_total", result="hit", tier="disk")
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            metrics.inc("postgen_cache_requests_total", result="miss")
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Сохраняет ответ на всех уровнях кэша.
+        """
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """
+        Удаляет ответ со всех уровней кэша.
+        """
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self) -> None:
+        """
+        Очищает кэш и сбрасывает счётчики.
+        """
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        Доля попаданий среди всех обращений к кэшу.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,118 @@
+# generators/clients.py
+"""
+Общие для процесса клиенты API, создаваемые при первом обращении.
+
+Пакеты vertexai, google.cloud и openai импортируются только здесь и только когда
+клиент действительно нужен: импорт vertexai занимает около двух секунд,
+а короткие CLI-запуски и создание генераторов на каждую тему не должны
+за это платить.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_vertex_inits: set[tuple[str, str]] = set()
+_storage_clients: dict[str, object] = {}
+_generative_models: dict[tuple[str, str | None], object] = {}
+_image_models: dict[str, object] = {}
+_openai_clients: dict[tuple[str, str], object] = {}
+
+
+def init_vertex(project_id: str, location: str) -> None:
+    """
+    Вызывает vertexai.init один раз для пары (проект, регион).
+    """
+    key = (project_id, location)
+    if key in _vertex_inits:
+        return
+    with _lock:
+        if key not in _vertex_inits:
+            import vertexai
+
+            vertexai.init(project=project_id, location=location)
+            _vertex_inits.add(key)
+            logger.info(f"Vertex AI инициализирован: {project_id}/{location}")
+
+
+def get_storage_client(project_id: str):
+    """
+    Возвращает общий storage.Client для проекта.
+    """
+    client = _storage_clients.get(project_id)
+    if client is None:
+        with _lock:
+            client = _storage_clients.get(project_id)
+            if client is None:
+                from google.cloud import storage
+
+                client = storage.Client(project=project_id)
+                _storage_clients[project_id] = client
+    return client
+
+
+def get_generative_model(model_name: str, system_instruction: str | None = None):
+    """
+    Возвращает общий GenerativeModel для модели и системной инструкции.
+
+    Системная инструкция задаётся при создании модели, поэтому на каждую
+    инструкцию хранится свой экземпляр.
+    """
+    key = (model_name, system_instruction)
+    model = _generative_models.get(key)
+    if model is None:
+        with _lock:
+            model = _generative_models.get(key)
+            if model is None:
+                from vertexai.generative_models import GenerativeModel
+
+                model = GenerativeModel(model_name, system_instruction=system_instruction)
+                _generative_models[key] = model
+    return model
+
+
+def get_image_model(model_name: str):
+    """
+    Возвращает общий ImageGenerationModel.
+    """
+    model = _image_models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _image_models.get(model_name)
+            if model is None:
+                from vertexai.preview.vision_models import ImageGenerationModel
+
+                model = ImageGenerationModel.from_pretrained(model_name)
+                _image_models[model_name] = model
+    return model
+
+
+def get_openai_client(api_key: str, base_url: str):
+    """
+    Возвращает общий OpenAI-клиент (и его пул соединений) для ключа и адреса API.
+    """
+    key = (api_key, base_url)
+    client = _openai_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                from openai import OpenAI
+
+                client = OpenAI(api_key=api_key, base_url=base_url)
+                _openai_clients[key] = client
+    return client
+
+
+def reset() -> None:
+    """
+    Сбрасывает созданные клиенты, например после смены учётных данных.
+    """
+    with _lock:
+        _vertex_inits.clear()
+        _storage_clients.clear()
+        _generative_models.clear()
+        _image_models.clear()
+        _openai_clients.clear()
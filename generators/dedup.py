@@ -0,0 +1,161 @@
+# generators/dedup.py
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Простое число Мерсенна 2^31 - 1: произведения a * x остаются в пределах uint64
+_PRIME = (1 << 31) - 1
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+class NearDuplicateIndex:
+    """
+    Индекс почти дубликатов сгенерированных постов на MinHash и LSH.
+
+    Текст нормализуется и разбивается на символьные шинглы, MinHash-подпись
+    вычисляется векторно в numpy. Подписи раскладываются по корзинам LSH,
+    поэтому проверка сравнивает новый пост только с кандидатами из общих
+    корзин, а не со всеми прошлыми постами. Сходство — оценка коэффициента
+    Жаккара по совпадающим позициям подписей.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 32, shingle_size: int = 5,
+                 db_path: str | None = None, seed: int = 1):
+        """
+        Args:
+            threshold (float): Порог сходства, начиная с которого пост считается дубликатом
+            num_perm (int): Длина MinHash-подписи
+            bands (int): Число полос LSH (num_perm должно делиться на bands)
+            shingle_size (int): Длина символьного шингла
+            db_path (str | None): Файл SQLite для хранения подписей между запусками
+            seed (int): Зерно хэш-функций; должно совпадать для одной базы
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._texts: list[str] = []
+        self._buckets: dict[tuple[int, bytes], list[int]] = {}
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                "id INTEGER PRIMARY KEY, text TEXT NOT NULL, signature BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            rows = self._db.execute("SELECT text, signature FROM posts ORDER BY id").fetchall()
+            for text, blob in rows:
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                if signature.size == num_perm:
+                    self._append(text, signature)
+            logger.info(f"Индекс дубликатов: загружено {len(self._texts)} постов из {db_path}")
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Вычисляет MinHash-подпись текста.
+        """
+        normalized = _NON_WORD.sub(" ", text.lower()).strip()
+        k = self.shingle_size
+        if len(normalized) <= k:
+            shingles = {normalized}
+        else:
+            shingles = {normalized[i:i + k] for i in range(len(normalized) - k + 1)}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) & _PRIME for shingle in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def find_duplicate(self, text: str) -> tuple[str, float] | None:
+        """
+        Ищет самый похожий из сохранённых постов со сходством не ниже порога.
+
+        Returns:
+            tuple[str, float] | None: (текст найденного поста, сходство) или None
+        """
+        signature = self.signature(text)
+        with self._lock:
+            return self._find(signature)
+
+    def add(self, text: str) -> None:
+        """
+        Добавляет пост в индекс.
+        """
+        signature = self.signature(text)
+        with self._lock:
+            self._store(text, signature)
+
+    def add_if_unique(self, text: str) -> tuple[str, float] | None:
+        """
+        Атомарно проверяет пост и добавляет его, если дубликатов нет.
+
+        Returns:
+            tuple[str, float] | None: Найденный дубликат или None, если пост добавлен
+        """
+        signature = self.signature(text)
+        with self._lock:
+            match = self._find(signature)
+            if match is None:
+                self._store(text, signature)
+            return match
+
+    def _band_keys(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _find(self, signature: np.ndarray) -> tuple[str, float] | None:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        if not candidates:
+            return None
+
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[ids] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        if similarity[best] < self.threshold:
+            return None
+        return self._texts[ids[best]], float(similarity[best])
+
+    def _store(self, text: str, signature: np.ndarray) -> None:
+        self._append(text, signature)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT INTO posts (text, signature, created_at) VALUES (?, ?, ?)",
+                (text, signature.tobytes(), time.time())
+            )
+            self._db.commit()
+
+    def _append(self, text: str, signature: np.ndarray) -> None:
+        index = len(self._texts)
+        if index == len(self._signatures):
+            # Матрица растёт удвоением, чтобы добавление оставалось амортизированно O(1)
+            grown = np.empty((max(64, 2 * index), self.num_perm), dtype=np.uint32)
+            grown[:index] = self._signatures[:index]
+            self._signatures = grown
+        self._signatures[index] = signature
+        self._texts.append(text)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(index)
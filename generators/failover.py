@@ -0,0 +1,192 @@
+# generators/failover.py
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Protocol
+
+from generators.batch import map_concurrently, post_jobs, run_concurrently
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Задержка (сек) для бэкенда без успешных ответов — порядка таймаута запроса к модели
+FAILURE_LATENCY = 60.0
+
+
+class TextBackend(Protocol):
+    """
+    Общий интерфейс текстовых генераторов (DeepSeekPostGenerator, GeminiPostGenerator).
+    """
+    provider: str
+
+    def generate_post(self, topic: str | None = None, tone: str | None = None, refresh: bool = False) -> str | None: ...
+
+    def discard_post(self, topic: str | None = None, tone: str | None = None) -> None: ...
+
+    def generate_post_image_description(self, topic: str | None = None) -> str | None: ...
+
+
+class BackendStats:
+    """
+    Наблюдаемые показатели одного бэкенда: EWMA задержки и доли ошибок, окно для p95.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        self.alpha = alpha
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+                self._samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        """
+        Перцентиль задержки успешных вызовов или None, пока наблюдений мало.
+        """
+        with self._lock:
+            if len(self._samples) < 10:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    @property
+    def score(self) -> float:
+        """
+        Ожидаемая «стоимость» вызова: задержка, штрафуемая долей ошибок.
+        Бэкенды без наблюдений получают 0 и опробуются первыми. У бэкенда,
+        не давшего ни одного успешного ответа, задержка считается равной
+        FAILURE_LATENCY, чтобы он не оказался впереди работающего.
+        """
+        latency = self.latency
+        if latency is None:
+            latency = FAILURE_LATENCY if self.error_rate else 0.0
+        return latency * (1.0 + 10.0 * self.error_rate) + self.error_rate
+
+
+class FailoverPostGenerator:
+    """
+    Составной генератор текста поверх нескольких бэкендов.
+
+    Запрос уходит бэкенду с лучшими наблюдаемыми задержкой и долей ошибок;
+    при ошибке или пустом ответе — следующему. При hedge=True, если основной
+    бэкенд не ответил за свой p95, параллельно отправляется запрос запасному
+    и берётся первый успешный ответ.
+    """
+
+    def __init__(self, backends: list[TextBackend], tone: str, topic: str, hedge: bool = True,
+                 hedge_percentile: float = 95.0):
+        """
+        Инициализация составного генератора.
+
+        Args:
+            backends (list[TextBackend]): Бэкенды в порядке предпочтения
+            tone (str): Тон, в котором должен быть написан пост
+            topic (str): Тема поста
+            hedge (bool): Отправлять страхующий запрос при медленном ответе
+            hedge_percentile (float): Перцентиль задержки, после которого отправляется страхующий запрос
+        """
+        if not backends:
+            raise ValueError("Нужен хотя бы один бэкенд")
+        self.backends = list(backends)
+        self.tone = tone
+        self.topic = topic
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.stats = {id(backend): BackendStats() for backend in self.backends}
+        # Пул для основного и страхующего запросов; опоздавший ответ дорабатывает в фоне
+        self._pool = ThreadPoolExecutor(max_workers=2 * len(self.backends) + 8, thread_name_prefix="failover")
+
+    def _ranked(self) -> list[TextBackend]:
+        # sorted устойчива: при равных оценках сохраняется порядок предпочтения
+        return sorted(self.backends, key=lambda backend: self.stats[id(backend)].score)
+
+    def _timed(self, backend: TextBackend, call: Callable[[TextBackend], str | None]) -> str | None:
+        started = time.perf_counter()
+        try:
+            result = call(backend)
+        except Exception as e:
+            logger.error(f"Бэкенд {backend.provider}: {e}")
+            result = None
+        self.stats[id(backend)].record(time.perf_counter() - started, result is not None)
+        return result
+
+    def _call(self, call: Callable[[TextBackend], str | None]) -> str | None:
+        """
+        Выполняет запрос с переключением между бэкендами и страхующим запросом.
+        """
+        ranked = self._ranked()
+        while ranked:
+            primary = ranked.pop(0)
+            future = self._pool.submit(self._timed, primary, call)
+            pending = {future: primary}
+
+            delay = self.stats[id(primary)].percentile(self.hedge_percentile) if self.hedge and ranked else None
+            if delay is not None:
+                done, _ = wait(pending, timeout=delay)
+                if not done:
+                    backup = ranked.pop(0)
+                    logger.info(f"{primary.provider} не ответил за {delay:.2f} сек, страхующий запрос к {backup.provider}")
+                    metrics.inc("postgen_hedged_requests_total", provider=backup.provider)
+                    pending[self._pool.submit(self._timed, backup, call)] = backup
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    backend = pending.pop(finished)
+                    result = finished.result()
+                    if result is not None:
+                        return result
+                    logger.warning(f"Бэкенд {backend.provider} не вернул ответ")
+                    metrics.inc("postgen_failover_total", provider=backend.provider)
+
+        logger.error("Ни один бэкенд не вернул ответ")
+        return None
+
+    def generate_post(self, topic: str | None = None, tone: str | None = None, refresh: bool = False) -> str | None:
+        """
+        Генерирует текст поста для социальных сетей.
+        """
+        topic = topic or self.topic
+        tone = tone or self.tone
+        return self._call(lambda backend: backend.generate_post(topic, tone, refresh))
+
+    def discard_post(self, topic: str | None = None, tone: str | None = None) -> None:
+        """
+        Удаляет текст поста из кэшей всех бэкендов.
+        """
+        topic = topic or self.topic
+        tone = tone or self.tone
+        for backend in self.backends:
+            backend.discard_post(topic, tone)
+
+    async def generate_posts(self, jobs: list[tuple[str, str]], concurrency: int = 8) -> list[str | None]:
+        """
+        Асинхронно генерирует посты для набора пар (тема, тон).
+        """
+        logger.info(f"Пакетная генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return await run_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_many(self, topics: list[str], tones: str | list[str] | None = None,
+                           concurrency: int = 8) -> list[str | None]:
+        """
+        Генерирует посты для нескольких тем.
+        """
+        jobs = post_jobs(topics, tones, self.tone)
+        logger.info(f"Генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return map_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_image_description(self, topic: str | None = None) -> str | None:
+        """
+        Генерирует детализированный промпт для модели генерации изображений.
+        """
+        topic = topic or self.topic
+        return self._call(lambda backend: backend.generate_post_image_description(topic))
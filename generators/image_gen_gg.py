@@ -1,40 +1,109 @@
 import os
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
-from google.cloud import storage
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from PIL import Image
 from io import BytesIO
 import logging
 import re
-from google.api_core.exceptions import ResourceExhausted
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from generators import clients
+from generators.image_store import ImageStore
+from utils import metrics
+from utils.concurrency import get_concurrency_limiter
+from utils.rate_limiter import get_limiter, is_rate_limit_error
+from utils.singleflight import SingleFlight
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Максимальное число изображений, которое Imagen возвращает за один вызов
+MAX_IMAGES_PER_CALL = 4
+
+# Общая для процесса группа объединения одинаковых запросов к Imagen
+_inflight = SingleFlight("imagen")
+
+
+@dataclass
+class GeneratedImage:
+    """
+    Одно сгенерированное изображение, загруженное в GCS.
+    """
+    blob_name: str
+    signed_url: str
+    local_path: str | None = None
+
+
+@dataclass
+class ImageBatchResult:
+    """
+    Результат пакетной генерации для одного промпта.
+    """
+    prompt: str
+    images: list[GeneratedImage] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def urls(self) -> list[str]:
+        return [image.signed_url for image in self.images]
+
 
 class ImagenGenerator:
     """
     Класс для генерации изображений с использованием Google Cloud Imagen.
     """
 
-    def __init__(self, project_id: str, location: str, gcs_bucket_name: str):
+    def __init__(self, project_id: str, location: str, gcs_bucket_name: str, streaming_io: bool = False,
+                 storage_client=None, model_name: str = "imagegeneration@005",
+                 image_store: ImageStore | None = None):
         """
         Инициализация генератора изображений.
 
+        SDK Vertex AI, клиент GCS и модель создаются при первом запросе
+        и общие для всех экземпляров в процессе.
+
         Args:
             project_id (str): ID проекта Google Cloud
             location (str): Регион (например, 'us-central1')
             gcs_bucket_name (str): Имя GCS бакета
+            streaming_io (bool): Сохранять исходные байты без декодирования Pillow
+                и выполнять запись на диск параллельно с загрузкой в GCS
+            storage_client (storage.Client | None): Готовый клиент GCS (по умолчанию — общий клиент проекта)
+            model_name (str): Версия модели Imagen
+            image_store (ImageStore | None): Хранилище изображений по промпту; повторный
+                промпт не вызывает Imagen, а хранилище заменяет копию в generated_images/
         """
         logger.info("Инициализация ImagenGenerator...")
-        vertexai.init(project=project_id, location=location)
-        self.storage_client = storage.Client(project=project_id)
-        self.bucket = self.storage_client.bucket(gcs_bucket_name)
-        self.model = ImageGenerationModel.from_pretrained("imagegeneration@005")  # Исправленная версия модели
+        self.project_id = project_id
+        self.location = location
+        self.gcs_bucket_name = gcs_bucket_name
+        self.model_name = model_name
+        self._storage_client = storage_client
+        self._bucket = None
+        self.image_store = image_store
+        self.rate_limiter = get_limiter("imagen")
+        self.concurrency = get_concurrency_limiter("imagen")
+        self.streaming_io = streaming_io
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="imagen-io") if streaming_io else None
         logger.info("Генератор готов к работе")
 
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            self._storage_client = clients.get_storage_client(self.project_id)
+        return self._storage_client
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = self.storage_client.bucket(self.gcs_bucket_name)
+        return self._bucket
+
+    @property
+    def model(self):
+        clients.init_vertex(self.project_id, self.location)
+        return clients.get_image_model(self.model_name)
+
     def generate_image(self, prompt: str) -> str | None:
         """
         Генерирует изображение, сохраняет локально и в GCS, возвращает временный URL
@@ -45,51 +114,301 @@ class ImagenGenerator:
         Returns:
             str | None: Signed URL изображения или None при ошибке
         """
+        # Одновременные запросы с тем же промптом получают один и тот же URL — только в пределах
+        # одного проекта и бакета, иначе файл оказался бы не там, куда его ждёт вызывающий код
+        key = ("url", self.project_id, self.location, self.gcs_bucket_name, self.model_name, prompt)
+        return _inflight.do(key, self._generate_image, prompt)
+
+    def _generate_image(self, prompt: str) -> str | None:
         logger.info(f"Генерация изображения по промпту: '{prompt}'")
 
         # Генерация безопасного имени файла
         safe_prompt = re.sub(r"[^\w\d-]", "_", prompt)[:50]
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_prompt}.jpg"
-        local_path = os.path.join("generated_images", filename)
+        basename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_prompt}"
 
         try:
-            # 1. Генерация изображения
-            response = self.model.generate_images(
-                prompt=prompt,
-                number_of_images=1
-            )
-
-            if not response.images:
+            # 1. Генерация изображения (или чтение из хранилища)
+            image_bytes = self._generate_single(prompt)
+            if image_bytes is None:
                 logger.error("API не вернуло изображений")
                 return None
 
-            # 2. Получение изображения в виде байтов
-            image_bytes = response.images[0]._image_bytes
+            # 2. Локальная копия уже лежит в хранилище — сразу загружаем в GCS
+            if self.image_store is not None:
+                extension, content_type = _detect_image_format(image_bytes)
+                return self._upload_and_sign(image_bytes, f"{basename}.{extension}", content_type)
+
+            if self.streaming_io:
+                return self._store_streaming(image_bytes, basename)
+
+            filename = f"{basename}.jpg"
+            local_path = os.path.join("generated_images", filename)
 
             # 3. Сохранение локально
             os.makedirs("generated_images", exist_ok=True)
-            with Image.open(BytesIO(image_bytes)) as img:
-                img.save(local_path)
+            _save_decoded(image_bytes, local_path)
             logger.info(f"Изображение сохранено локально: {local_path}")
 
-            # 4. Загрузка в GCS
-            blob = self.bucket.blob(f"project-images/{filename}")
-            blob.upload_from_string(image_bytes, content_type="image/jpeg")
-            logger.info(f"Изображение загружено в GCS: gs://{self.bucket.name}/project-images/{filename}")
+            # 4. Загрузка в GCS и генерация временного URL
+            return self._upload_and_sign(image_bytes, filename, "image/jpeg")
 
-            # 5. Генерация временного URL
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=timedelta(minutes=60),
-                method="GET"
-            )
-            logger.info("Временный URL сгенерирован")
+        except Exception as e:
+            if is_rate_limit_error(e):
+                logger.error("Достигнут лимит квот Vertex AI. Повторите попытку позже.")
+            else:
+                logger.error(f"Ошибка при генерации изображения: {str(e)}")
+            return None
 
-            return signed_url
+    def generate_image_bytes(self, prompt: str) -> bytes | None:
+        """
+        Генерирует изображение и возвращает его байты без загрузки в GCS.
+
+        Байты можно сразу передать в VKPublisher.publish_post(image=...),
+        минуя лишнюю загрузку в бакет и повторное скачивание по signed URL.
+        Локальная копия сохраняется без декодирования.
+
+        Args:
+            prompt (str): Описание для генерации изображения
+
+        Returns:
+            bytes | None: Байты изображения или None при ошибке
+        """
+        logger.info(f"Генерация изображения по промпту: '{prompt}'")
+
+        try:
+            image_bytes = self._generate_single(prompt)
+            if image_bytes is None:
+                logger.error("API не вернуло изображений")
+                return None
+            if self.image_store is not None:
+                return image_bytes
+
+            safe_prompt = re.sub(r"[^\w\d-]", "_", prompt)[:50]
+            extension, _ = _detect_image_format(image_bytes)
+            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_prompt}.{extension}"
+            local_path = os.path.join("generated_images", filename)
+
+            if self._io_pool is not None:
+                self._io_pool.submit(_write_bytes, local_path, image_bytes).add_done_callback(_log_local_write)
+            else:
+                _write_bytes(local_path, image_bytes)
+                logger.info(f"Изображение сохранено локально: {local_path}")
+
+            return image_bytes
 
-        except ResourceExhausted:
-            logger.error("Достигнут лимит квот Vertex AI. Повторите попытку позже.")
-            return None
         except Exception as e:
-            logger.error(f"Ошибка при генерации изображения: {str(e)}")
-            return None
\ No newline at end of file
+            if is_rate_limit_error(e):
+                logger.error("Достигнут лимит квот Vertex AI. Повторите попытку позже.")
+            else:
+                logger.error(f"Ошибка при генерации изображения: {str(e)}")
+            return None
+
+    def generate_images(self, prompts: list[str], per_prompt: int = 1, concurrency: int = 4) -> list[ImageBatchResult]:
+        """
+        Генерирует несколько вариантов изображения для каждого промпта.
+
+        Варианты запрашиваются у модели одним вызовом (до MAX_IMAGES_PER_CALL),
+        промпты обрабатываются параллельно, а все полученные изображения
+        загружаются в GCS одним пакетом через общий пул соединений.
+
+        Args:
+            prompts (list[str]): Описания для генерации
+            per_prompt (int): Число вариантов на промпт
+            concurrency (int): Максимальное число одновременных запросов
+
+        Returns:
+            list[ImageBatchResult]: Результаты в порядке промптов
+        """
+        if per_prompt < 1:
+            raise ValueError("per_prompt должен быть не меньше 1")
+
+        logger.info(f"Пакетная генерация: {len(prompts)} промптов по {per_prompt} вариантов")
+        results = [ImageBatchResult(prompt=prompt) for prompt in prompts]
+        if not prompts:
+            return results
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # 1. Генерация вариантов для всех промптов
+            futures = [pool.submit(self._generate_variants, prompt, per_prompt) for prompt in prompts]
+            uploads = []
+            for index, (result, future) in enumerate(zip(results, futures)):
+                try:
+                    images_bytes = future.result()
+                except Exception as e:
+                    result.error = "Достигнут лимит квот Vertex AI" if is_rate_limit_error(e) else str(e)
+                    continue
+
+                if not images_bytes:
+                    result.error = "API не вернуло изображений"
+                    continue
+
+                safe_prompt = re.sub(r"[^\w\d-]", "_", result.prompt)[:50]
+                basename = f"{timestamp}_{index}_{safe_prompt}"
+                for variant, image_bytes in enumerate(images_bytes, start=1):
+                    uploads.append((result, pool.submit(self._store_variant, image_bytes, f"{basename}_{variant}")))
+
+            # 2. Пакетная загрузка в GCS
+            for result, future in uploads:
+                try:
+                    result.images.append(future.result())
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки изображения '{result.prompt}': {e}")
+                    result.error = str(e)
+
+        for result in results:
+            if result.error:
+                logger.error(f"Промпт '{result.prompt}': {result.error}")
+        return results
+
+    def download_image(self, blob_name: str) -> bytes:
+        """
+        Скачивает ранее загруженное изображение из бакета по имени объекта.
+        """
+        with metrics.timer("postgen_external_call_seconds", provider="gcs", operation="download"):
+            return self.bucket.blob(blob_name).download_as_bytes()
+
+    def derivative(self, prompt: str, name: str) -> Future:
+        """
+        Возвращает Future с путём к производному изображению для промпта
+        ('thumb', 'vk' или 'webp'). Требует image_store.
+        """
+        if self.image_store is None:
+            raise RuntimeError("Производные доступны только с image_store")
+        return self.image_store.derivative(ImageStore.make_key(prompt, self.model_name), name)
+
+    def _generate_single(self, prompt: str) -> bytes | None:
+        """
+        Возвращает одно изображение для промпта, по возможности из хранилища.
+        Одновременные запросы с тем же промптом разделяют один вызов Imagen.
+        """
+        key = ("bytes", self.project_id, self.location, self.model_name, prompt)
+        return _inflight.do(key, self._request_single, prompt)
+
+    def _request_single(self, prompt: str) -> bytes | None:
+        key = None
+        if self.image_store is not None:
+            key = ImageStore.make_key(prompt, self.model_name)
+            cached = self.image_store.get(key)
+            if cached is not None:
+                logger.info("Изображение взято из хранилища, Imagen не вызывается")
+                return cached
+
+        images = self._generate_variants(prompt, 1)
+        if not images:
+            return None
+        if key is not None:
+            extension, _ = _detect_image_format(images[0])
+            path = self.image_store.put(key, images[0], extension)
+            logger.info(f"Изображение сохранено в хранилище: {path}")
+        return images[0]
+
+    def _generate_variants(self, prompt: str, count: int) -> list[bytes]:
+        """
+        Запрашивает у модели `count` вариантов изображения минимальным числом вызовов.
+        """
+        images = []
+        while len(images) < count:
+            self.rate_limiter.acquire()
+            with (
+                self.concurrency.slot(),
+                metrics.timer("postgen_external_call_seconds", provider="imagen", operation="generate_images")
+            ):
+                response = self.model.generate_images(
+                    prompt=prompt,
+                    number_of_images=min(MAX_IMAGES_PER_CALL, count - len(images))
+                )
+            if not response.images:
+                break
+            images.extend(image._image_bytes for image in response.images)
+        return images
+
+    def _store_variant(self, image_bytes: bytes, basename: str) -> GeneratedImage:
+        """
+        Сохраняет вариант изображения локально и в GCS.
+        """
+        extension, content_type = _detect_image_format(image_bytes)
+        filename = f"{basename}.{extension}"
+        local_path = os.path.join("generated_images", filename)
+
+        if self.streaming_io:
+            _write_bytes(local_path, image_bytes)
+        else:
+            os.makedirs("generated_images", exist_ok=True)
+            _save_decoded(image_bytes, local_path)
+
+        signed_url = self._upload_and_sign(image_bytes, filename, content_type)
+        return GeneratedImage(
+            blob_name=f"project-images/{filename}",
+            signed_url=signed_url,
+            local_path=local_path
+        )
+
+    def _upload_and_sign(self, image_bytes: bytes, filename: str, content_type: str) -> str:
+        """
+        Загружает байты изображения в GCS и возвращает временный URL.
+        """
+        blob = self.bucket.blob(f"project-images/{filename}")
+        with metrics.timer("postgen_external_call_seconds", provider="gcs", operation="upload"):
+            blob.upload_from_string(image_bytes, content_type=content_type)
+        metrics.inc("postgen_uploaded_bytes_total", len(image_bytes), target="gcs")
+        logger.info(f"Изображение загружено в GCS: gs://{self.bucket.name}/project-images/{filename}")
+
+        signed_url = blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(minutes=60),
+            method="GET"
+        )
+        logger.info("Временный URL сгенерирован")
+        return signed_url
+
+    def _store_streaming(self, image_bytes: bytes, basename: str) -> str:
+        """
+        Сохраняет исходные байты на диск в фоне и одновременно загружает их в GCS.
+
+        Возвращает URL сразу после загрузки, не дожидаясь окончания записи на диск.
+        """
+        extension, content_type = _detect_image_format(image_bytes)
+        filename = f"{basename}.{extension}"
+        local_path = os.path.join("generated_images", filename)
+
+        future = self._io_pool.submit(_write_bytes, local_path, image_bytes)
+        future.add_done_callback(_log_local_write)
+
+        return self._upload_and_sign(image_bytes, filename, content_type)
+
+
+def _detect_image_format(image_bytes: bytes) -> tuple[str, str]:
+    """
+    Определяет формат изображения по сигнатуре без декодирования.
+    """
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return "jpg", "image/jpeg"
+
+
+def _save_decoded(image_bytes: bytes, path: str) -> None:
+    """
+    Сохраняет изображение через Pillow (формат определяется по расширению).
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(image_bytes)) as img:
+        img.save(path)
+
+
+def _write_bytes(path: str, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _log_local_write(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Ошибка сохранения изображения на диск: {error}")
+    else:
+        logger.info(f"Изображение сохранено локально: {future.result()}")
@@ -0,0 +1,240 @@
+# generators/image_store.py
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Производные изображения: имя -> (максимальная сторона или None, формат Pillow, расширение, качество)
+DERIVATIVES = {
+    "thumb": (320, "JPEG", "jpg", 80),
+    "vk": (1280, "JPEG", "jpg", 90),  # VK ужимает фото на стене до 1280 px по большей стороне
+    "webp": (None, "WEBP", "webp", 85),
+}
+
+
+class ImageStore:
+    """
+    Локальное хранилище изображений с адресацией по промпту и модели.
+
+    Каждый ключ — каталог с оригиналом и производными (миниатюра, размер
+    для VK, WebP). Производные создаются по запросу в пуле процессов и не
+    блокируют вызывающий поток. Объём на диске ограничен max_bytes: при
+    превышении удаляются давно не использованные ключи целиком.
+    """
+
+    def __init__(self, root: str = os.path.join("generated_images", "store"), max_bytes: int = 1 << 30,
+                 workers: int | None = None, prefetch: tuple[str, ...] = ()):
+        """
+        Args:
+            root (str): Каталог хранилища
+            max_bytes (int): Предельный объём хранилища в байтах
+            workers (int | None): Число процессов для преобразований (по умолчанию — число ядер)
+            prefetch (tuple[str, ...]): Производные, создаваемые в фоне сразу после put()
+        """
+        unknown = set(prefetch) - set(DERIVATIVES)
+        if unknown:
+            raise ValueError(f"Неизвестные производные: {', '.join(sorted(unknown))}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.prefetch = prefetch
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending: dict[tuple[str, str], Future] = {}
+        # ключ -> [размер на диске, время последнего обращения]
+        self._entries: dict[str, list] = {}
+        self._size = 0
+        self._scan()
+
+    @staticmethod
+    def make_key(prompt: str, model_name: str) -> str:
+        """
+        Ключ изображения: хэш модели и промпта.
+        """
+        return hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _scan(self) -> None:
+        if not os.path.isdir(self.root):
+            return
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+                self._entries[key] = [size, os.stat(entry_dir).st_mtime]
+                self._size += size
+        logger.info(f"Хранилище изображений: {len(self._entries)} ключей, {self._size / 2**20:.1f} МБ")
+
+    def original_path(self, key: str) -> str | None:
+        """
+        Путь к оригиналу или None, если ключа нет.
+        """
+        entry_dir = self._dir(key)
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.startswith("original."):
+                return os.path.join(entry_dir, name)
+        return None
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Возвращает байты оригинала или None.
+        """
+        path = self.original_path(key)
+        if path is None:
+            metrics.inc("postgen_cache_requests_total", result="miss", tier="image")
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        self._touch(key)
+        metrics.inc("postgen_cache_requests_total", result="hit", tier="image")
+        return data
+
+    def put(self, key: str, data: bytes, extension: str) -> str:
+        """
+        Сохраняет оригинал и запускает фоновое создание производных из prefetch.
+
+        Returns:
+            str: Путь к сохранённому оригиналу
+        """
+        existing = self.original_path(key)
+        if existing is not None:
+            self._touch(key)
+            return existing
+
+        entry_dir = self._dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        path = os.path.join(entry_dir, f"original.{extension}")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._account(key, len(data))
+        for name in self.prefetch:
+            self.derivative(key, name)
+        self._evict(keep=key)
+        return path
+
+    def derivative(self, key: str, name: str) -> Future:
+        """
+        Возвращает Future с путём к производному изображению.
+
+        Готовая производная отдаётся сразу, иначе преобразование ставится
+        в пул процессов; повторные запросы получают тот же Future.
+        """
+        if name not in DERIVATIVES:
+            raise ValueError(f"Неизвестная производная: {name}")
+        max_side, image_format, extension, quality = DERIVATIVES[name]
+        path = os.path.join(self._dir(key), f"{name}.{extension}")
+
+        with self._lock:
+            pending = self._pending.get((key, name))
+            if pending is not None:
+                return pending
+            if os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+                self._touch_locked(key)
+                return future
+
+            source = self.original_path(key)
+            if source is None:
+                raise KeyError(key)
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            future = self._pool.submit(_render, source, path, max_side, image_format, quality)
+            self._pending[(key, name)] = future
+
+        def on_done(done: Future):
+            with self._lock:
+                self._pending.pop((key, name), None)
+            if done.exception() is not None:
+                logger.error(f"Ошибка создания производной '{name}' для {key}: {done.exception()}")
+                return
+            self._account(key, os.path.getsize(done.result()))
+            self._evict(keep=key)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _touch(self, key: str) -> None:
+        with self._lock:
+            self._touch_locked(key)
+
+    def _touch_locked(self, key: str) -> None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] = time.time()
+
+    def _account(self, key: str, size: int) -> None:
+        with self._lock:
+            entry = self._entries.setdefault(key, [0, 0.0])
+            entry[0] += size
+            entry[1] = time.time()
+            self._size += size
+
+    def _evict(self, keep: str | None = None) -> None:
+        """
+        Удаляет давно не использованные ключи, пока объём превышает max_bytes.
+        Ключ keep и ключи с незавершёнными преобразованиями не удаляются.
+        """
+        with self._lock:
+            if self._size <= self.max_bytes:
+                return
+            busy = {key for key, _ in self._pending} | {keep}
+            for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+                if self._size <= self.max_bytes:
+                    break
+                if key in busy:
+                    continue
+                shutil.rmtree(self._dir(key), ignore_errors=True)
+                del self._entries[key]
+                self._size -= size
+                metrics.inc("postgen_image_store_evictions_total")
+                logger.info(f"Из хранилища удалён ключ {key} ({size} байт)")
+
+    @property
+    def size(self) -> int:
+        """
+        Текущий объём хранилища в байтах.
+        """
+        return self._size
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+def _render(source: str, destination: str, max_side: int | None, image_format: str, quality: int) -> str:
+    """
+    Создаёт производное изображение. Выполняется в отдельном процессе.
+    """
+    from PIL import Image
+
+    with Image.open(source) as img:
+        if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if max_side is not None:
+            img.thumbnail((max_side, max_side))
+        tmp_path = f"{destination}.{os.getpid()}.tmp"
+        img.save(tmp_path, format=image_format, quality=quality)
+    os.replace(tmp_path, destination)
+    return destination
@@ -0,0 +1,137 @@
+# generators/prompts.py
+
+import string
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    """
+    Готовый запрос к текстовой модели.
+    """
+    system: str
+    user: str
+    temperature: float
+    max_tokens: int
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Версионированный шаблон запроса с явными параметрами генерации.
+
+    Системная часть не содержит переменных: одинаковый префикс во всех
+    запросах позволяет провайдеру переиспользовать кэш контекста
+    (prefix cache DeepSeek, неявное кэширование Gemini). Всё, что меняется
+    от запроса к запросу, находится в конце — в пользовательской части.
+    """
+    name: str
+    version: int
+    system: str
+    user: str
+    temperature: float
+    max_tokens: int = 2048
+    fields: frozenset[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Разбор шаблона выполняется один раз при регистрации, а не на каждый запрос
+        formatter = string.Formatter()
+        system_fields = {name for _, name, _, _ in formatter.parse(self.system) if name is not None}
+        if system_fields:
+            raise ValueError(
+                f"Шаблон '{self.name}' v{self.version}: системная часть должна быть статичной, "
+                f"найдены переменные {sorted(system_fields)}"
+            )
+        user_fields = frozenset(name for _, name, _, _ in formatter.parse(self.user) if name)
+        object.__setattr__(self, "fields", user_fields)
+
+    def render(self, **values) -> RenderedPrompt:
+        """
+        Подставляет значения в пользовательскую часть шаблона.
+        """
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Шаблон '{self.name}' v{self.version}: не заданы {sorted(missing)}")
+        return RenderedPrompt(
+            system=self.system,
+            user=self.user.format_map(values),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+
+
+class PromptRegistry:
+    """
+    Реестр шаблонов по имени и версии.
+
+    По умолчанию выдаётся последняя версия шаблона; конкретную версию можно
+    закрепить через pin(), например чтобы воспроизвести старые результаты.
+    """
+
+    def __init__(self):
+        self._templates: dict[str, dict[int, PromptTemplate]] = {}
+        self._pinned: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        with self._lock:
+            versions = self._templates.setdefault(template.name, {})
+            if template.version in versions:
+                raise ValueError(f"Шаблон '{template.name}' v{template.version} уже зарегистрирован")
+            versions[template.version] = template
+        return template
+
+    def pin(self, name: str, version: int | None) -> None:
+        """
+        Закрепляет версию шаблона (None — снова использовать последнюю).
+        """
+        self.get(name, version)
+        with self._lock:
+            if version is None:
+                self._pinned.pop(name, None)
+            else:
+                self._pinned[name] = version
+
+    def get(self, name: str, version: int | None = None) -> PromptTemplate:
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"Неизвестный шаблон: {name}")
+        version = version if version is not None else self._pinned.get(name, max(versions))
+        try:
+            return versions[version]
+        except KeyError:
+            raise KeyError(f"Шаблон '{name}' не имеет версии {version}") from None
+
+    def render(self, name: str, version: int | None = None, **values) -> RenderedPrompt:
+        return self.get(name, version).render(**values)
+
+
+PROMPTS = PromptRegistry()
+
+# Тон перенесён из системной части в пользовательскую, чтобы префикс был общим для всех запросов
+PROMPTS.register(PromptTemplate(
+    name="post",
+    version=1,
+    system="Ты высококвалифицированный SMM специалист, который генерирует тексты для постов.",
+    user=(
+        "Тон сообщений: {tone}. "
+        "Сгенерируй пост для соцсетей на тему: '{topic}'. "
+        "Пост должен быть привлекательным, содержательным и соответствовать тону {tone}."
+    ),
+    temperature=0.4
+))
+
+PROMPTS.register(PromptTemplate(
+    name="image_prompt",
+    version=1,
+    system=(
+        "Ты — эксперт по созданию промптов для генерации изображений. "
+        "Генерируй только англоязычные промпты для моделей типа Imagen или Midjourney. "
+        "Промпт должен включать: объект, окружение, стиль, освещение, детали. Пример: "
+        "'photo of a sleek, modern kitchen knife with Damascus steel pattern, resting on dark granite next to "
+        "chopped vegetables, cinematic lighting, ultra-realistic, 8k'."
+    ),
+    user="Создай промпт для генерации изображения на тему: '{topic}'.",
+    temperature=0.4
+))
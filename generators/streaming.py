@@ -0,0 +1,43 @@
+# generators/streaming.py
+
+from typing import Iterable, Iterator
+
+
+def clean_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Применяет к потоку фрагментов ту же очистку, что и .strip().strip('"').
+
+    Ведущие пробелы и кавычки отбрасываются сразу, а возможный хвост из кавычек
+    и пробелов придерживается до прихода следующего фрагмента. Склейка
+    результата совпадает с ''.join(chunks).strip().strip('"').
+
+    Args:
+        chunks (Iterable[str]): Фрагменты текста от модели
+
+    Yields:
+        str: Очищенные фрагменты
+    """
+    phase = "whitespace"  # whitespace -> quotes -> body
+    pending = ""
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+
+        if phase == "whitespace":
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            phase = "quotes"
+        if phase == "quotes":
+            chunk = chunk.lstrip('"')
+            if not chunk:
+                continue
+            phase = "body"
+
+        text = pending + chunk
+        body = text.rstrip()
+        body = body.rstrip('"')
+        pending = text[len(body):]
+        if body:
+            yield body
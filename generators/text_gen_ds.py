@@ -1,20 +1,35 @@
 # generators/text_gen_ds.py
 
-import os
 import logging
 import time
-from openai import OpenAI
-from google.api_core.exceptions import ResourceExhausted
+from typing import Iterator
+
+from generators import clients
+from generators.batch import map_concurrently, post_jobs, run_concurrently
+from generators.cache import ResponseCache
+from generators.prompts import PROMPTS, PromptRegistry, RenderedPrompt
+from generators.streaming import clean_stream
+from utils import metrics
+from utils.concurrency import get_concurrency_limiter
+from utils.rate_limiter import backoff_delay, get_limiter, is_rate_limit_error, retry_after_from_error
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Общая для процесса группа объединения одинаковых запросов к DeepSeek
+_inflight = SingleFlight("deepseek")
+
 
 class DeepSeekPostGenerator:
     """
     Класс для генерации текстового контента с помощью модели DeepSeek.
     """
 
-    def __init__(self, api_key: str, tone: str, topic: str, model_name: str = "deepseek-chat"):
+    provider = "deepseek"
+
+    def __init__(self, api_key: str, tone: str, topic: str, model_name: str = "deepseek-chat",
+                 cache: ResponseCache | None = None, base_url: str = "https://api.deepseek.com",
+                 prompts: PromptRegistry | None = None):
         """
         Инициализация клиента и параметров поста.
 
@@ -23,52 +38,90 @@ class DeepSeekPostGenerator:
             tone (str): Тон, в котором должен быть написан пост.
             topic (str): Тема поста.
             model_name (str): Название используемой модели.
+            cache (ResponseCache | None): Кэш ответов (None — без кэширования).
+            base_url (str): Адрес OpenAI-совместимого API.
+            prompts (PromptRegistry | None): Реестр шаблонов запросов (по умолчанию — общий PROMPTS).
         """
         logger.info("Инициализация генератора текста DeepSeek...")
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
+        # Клиент общий для всех генераторов с тем же ключом, соединения переиспользуются
+        self.client = clients.get_openai_client(api_key, base_url)
         self.model = model_name
         self.tone = tone
         self.topic = topic
+        self.cache = cache
+        self.prompts = prompts or PROMPTS
+        self.rate_limiter = get_limiter("deepseek")
+        self.concurrency = get_concurrency_limiter("deepseek")
         logger.info("Текстовый генератор DeepSeek готов к работе.")
 
-    def _generate_content(self, system_prompt: str, user_prompt: str, max_retries: int = 3) -> str | None:
+    def _generate_content(self, prompt: RenderedPrompt, max_retries: int = 3, refresh: bool = False) -> str | None:
         """
         Общий метод для генерации контента с обработкой ошибок и повторными попытками.
 
         Args:
-            system_prompt (str): Системная инструкция
-            user_prompt (str): Пользовательский запрос
+            prompt (RenderedPrompt): Запрос и параметры генерации из реестра шаблонов
             max_retries (int): Максимальное количество попыток
+            refresh (bool): Запросить новый ответ, минуя кэш и идущие одинаковые запросы
 
         Returns:
             str | None: Сгенерированный текст
         """
+        key = ResponseCache.make_key(self.model, prompt.system, prompt.user, prompt.temperature)
+        if refresh:
+            return self._request_content(prompt, key, max_retries)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Ответ взят из кэша")
+                return cached
+
+        # Одновременные одинаковые запросы (в том числе из других экземпляров) разделяют один вызов API
+        return _inflight.do(key, self._request_content, prompt, key, max_retries)
+
+    def _request_content(self, prompt: RenderedPrompt, cache_key: str, max_retries: int) -> str | None:
+        """
+        Запрос к API с повторными попытками; успешный ответ сохраняется в кэш.
+        """
         for attempt in range(max_retries):
+            if attempt:
+                metrics.inc("postgen_external_call_retries_total", provider="deepseek")
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.7 if "описание" in system_prompt else 0.4,
-                    max_tokens=2048
-                )
+                self.rate_limiter.acquire()
+                with (
+                    self.concurrency.slot(),
+                    metrics.timer("postgen_external_call_seconds", provider="deepseek", operation="chat")
+                ):
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": prompt.system},
+                            {"role": "user", "content": prompt.user}
+                        ],
+                        temperature=prompt.temperature,
+                        max_tokens=prompt.max_tokens
+                    )
+
+                if response.usage is not None:
+                    metrics.inc("postgen_llm_tokens_total", response.usage.prompt_tokens, provider="deepseek", kind="prompt")
+                    metrics.inc("postgen_llm_tokens_total", response.usage.completion_tokens, provider="deepseek", kind="completion")
+                    # Токены общего префикса, попавшие в кэш контекста DeepSeek
+                    metrics.inc("postgen_llm_tokens_total", getattr(response.usage, "prompt_cache_hit_tokens", 0) or 0,
+                                provider="deepseek", kind="cached_prompt")
 
                 if response.choices and response.choices[0].message.content:
-                    return response.choices[0].message.content.strip().strip('"')
+                    text = response.choices[0].message.content.strip().strip('"')
+                    if self.cache is not None:
+                        self.cache.set(cache_key, text)
+                    return text
                 else:
                     logger.warning(f"Пустой ответ от DeepSeek (попытка {attempt + 1}/{max_retries})")
 
             except Exception as e:
                 logger.error(f"Ошибка генерации: {e}")
-                if "rate limit" in str(e).lower():
-                    wait_time = (attempt + 1) * 5
-                    logger.warning(f"Достигнут лимит квот. Повтор через {wait_time} сек...")
+                if is_rate_limit_error(e):
+                    wait_time = backoff_delay(attempt, retry_after=retry_after_from_error(e))
+                    logger.warning(f"Достигнут лимит квот. Повтор через {wait_time:.1f} сек...")
                     time.sleep(wait_time)
                 else:
                     return None
@@ -76,27 +129,169 @@ class DeepSeekPostGenerator:
         logger.error(f"Не удалось получить ответ после {max_retries} попыток")
         return None
 
-    def generate_post(self) -> str | None:
+    def _stream_content(self, prompt: RenderedPrompt, max_retries: int = 3) -> Iterator[str]:
+        """
+        Потоковый вариант _generate_content: выдаёт очищенные фрагменты ответа.
+
+        Повторные попытки выполняются только до получения первого фрагмента.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(self.model, prompt.system, prompt.user, prompt.temperature)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Ответ взят из кэша")
+                yield cached
+                return
+
+        for attempt in range(max_retries):
+            if attempt:
+                metrics.inc("postgen_external_call_retries_total", provider="deepseek")
+            parts = []
+            try:
+                with self.concurrency.slot(track_latency=False):
+                    self.rate_limiter.acquire()
+                    started = time.perf_counter()
+                    stream = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": prompt.system},
+                            {"role": "user", "content": prompt.user}
+                        ],
+                        temperature=prompt.temperature,
+                        max_tokens=prompt.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+
+                    for piece in clean_stream(self._stream_deltas(stream, started)):
+                        parts.append(piece)
+                        yield piece
+
+                    if parts:
+                        if cache_key is not None:
+                            self.cache.set(cache_key, "".join(parts))
+                        return
+                    logger.warning(f"Пустой ответ от DeepSeek (попытка {attempt + 1}/{max_retries})")
+
+            except Exception as e:
+                if parts:
+                    # Часть ответа уже отдана потребителю: молча завершить поток значило бы вернуть обрезанный текст
+                    logger.error(f"Поток прерван после {len(parts)} фрагментов: {e}")
+                    raise
+                if is_rate_limit_error(e):
+                    wait_time = backoff_delay(attempt, retry_after=retry_after_from_error(e))
+                    logger.warning(f"Достигнут лимит квот. Повтор через {wait_time:.1f} сек...")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"Ошибка генерации: {e}")
+                    return
+
+        logger.error(f"Не удалось получить ответ после {max_retries} попыток")
+
+    @staticmethod
+    def _stream_deltas(stream, started: float) -> Iterator[str]:
+        """
+        Извлекает текст из событий потока и учитывает время до первого фрагмента.
+        """
+        first = True
+        for event in stream:
+            if event.usage is not None:
+                metrics.inc("postgen_llm_tokens_total", event.usage.prompt_tokens, provider="deepseek", kind="prompt")
+                metrics.inc("postgen_llm_tokens_total", event.usage.completion_tokens, provider="deepseek", kind="completion")
+                metrics.inc("postgen_llm_tokens_total", getattr(event.usage, "prompt_cache_hit_tokens", 0) or 0,
+                            provider="deepseek", kind="cached_prompt")
+            if not event.choices or not event.choices[0].delta.content:
+                continue
+            if first:
+                metrics.observe("postgen_first_chunk_seconds", time.perf_counter() - started, provider="deepseek")
+                first = False
+            yield event.choices[0].delta.content
+
+    def generate_post(self, topic: str | None = None, tone: str | None = None, refresh: bool = False) -> str | None:
         """
         Генерирует текст поста для социальных сетей.
+
+        Args:
+            topic (str | None): Тема поста (по умолчанию — заданная при создании)
+            tone (str | None): Тон поста (по умолчанию — заданный при создании)
+            refresh (bool): Сгенерировать новый текст, не читая кэш (например, взамен отклонённого)
+        """
+        topic = topic or self.topic
+        tone = tone or self.tone
+        prompt = self.prompts.render("post", topic=topic, tone=tone)
+
+        logger.info(f"Генерация поста: тема='{topic}', тон='{tone}'")
+        return self._generate_content(prompt, refresh=refresh)
+
+    def discard_post(self, topic: str | None = None, tone: str | None = None) -> None:
+        """
+        Удаляет из кэша текст поста для темы и тона, например отклонённый как дубликат.
+        """
+        if self.cache is None:
+            return
+        prompt = self.prompts.render("post", topic=topic or self.topic, tone=tone or self.tone)
+        self.cache.delete(ResponseCache.make_key(self.model, prompt.system, prompt.user, prompt.temperature))
+
+    def generate_post_stream(self, topic: str | None = None, tone: str | None = None) -> Iterator[str]:
+        """
+        Генерирует текст поста, выдавая фрагменты по мере их получения от модели.
+
+        Склейка фрагментов совпадает с результатом generate_post(). При ошибке
+        до первого фрагмента поток просто завершается, после него исключение
+        пробрасывается, чтобы обрезанный текст не приняли за полный.
+
+        Yields:
+            str: Очередной фрагмент текста
         """
-        system_prompt = f"Ты высококвалифицированный SMM специалист, который генерирует тексты для постов. Тон сообщений: {self.tone}."
-        user_prompt = f"Сгенерируй пост для соцсетей на тему: '{self.topic}'. Пост должен быть привлекательным, содержательным и соответствовать тону {self.tone}."
+        topic = topic or self.topic
+        tone = tone or self.tone
+        prompt = self.prompts.render("post", topic=topic, tone=tone)
 
-        logger.info(f"Генерация поста: тема='{self.topic}', тон='{self.tone}'")
-        return self._generate_content(system_prompt, user_prompt)
+        logger.info(f"Потоковая генерация поста: тема='{topic}', тон='{tone}'")
+        yield from self._stream_content(prompt)
 
-    def generate_post_image_description(self) -> str | None:
+    async def generate_posts(self, jobs: list[tuple[str, str]], concurrency: int = 8) -> list[str | None]:
+        """
+        Асинхронно генерирует посты для набора пар (тема, тон).
+
+        Args:
+            jobs (list[tuple[str, str]]): Список пар (тема, тон)
+            concurrency (int): Максимальное число одновременных запросов
+
+        Returns:
+            list[str | None]: Тексты постов в порядке заданий
+        """
+        logger.info(f"Пакетная генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return await run_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_many(self, topics: list[str], tones: str | list[str] | None = None,
+                           concurrency: int = 8) -> list[str | None]:
+        """
+        Генерирует посты для нескольких тем через один клиент и общий пул соединений.
+
+        Args:
+            topics (list[str]): Темы постов
+            tones (str | list[str] | None): Один тон на все темы, по тону на каждую
+                тему или None (тон, заданный при создании)
+            concurrency (int): Максимальное число одновременных запросов
+
+        Returns:
+            list[str | None]: Тексты постов в порядке тем
+        """
+        jobs = post_jobs(topics, tones, self.tone)
+        logger.info(f"Генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return map_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_image_description(self, topic: str | None = None) -> str | None:
         """
         Генерирует детализированный промпт для модели генерации изображений.
+
+        Args:
+            topic (str | None): Тема поста (по умолчанию — заданная при создании)
         """
-        system_prompt = (
-            "Ты — эксперт по созданию промптов для генерации изображений. "
-            "Генерируй только англоязычные промпты для моделей типа Imagen или Midjourney. "
-            "Промпт должен включать: объект, окружение, стиль, освещение, детали. Пример: "
-            "'photo of a sleek, modern kitchen knife with Damascus steel pattern, resting on dark granite next to chopped vegetables, cinematic lighting, ultra-realistic, 8k'."
-        )
-        user_prompt = f"Создай промпт для генерации изображения на тему: '{self.topic}'."
+        topic = topic or self.topic
+        prompt = self.prompts.render("image_prompt", topic=topic)
 
-        logger.info(f"Генерация промпта для изображения: тема='{self.topic}'")
-        return self._generate_content(system_prompt, user_prompt)
\ No newline at end of file
+        logger.info(f"Генерация промпта для изображения: тема='{topic}'")
+        return self._generate_content(prompt)
\ No newline at end of file
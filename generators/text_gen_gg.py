@@ -1,100 +1,454 @@
 # generators/text_gen_gg.py
 
-import vertexai
-from vertexai.generative_models import GenerativeModel
+import json
 import logging
-from google.api_core.exceptions import ResourceExhausted
 import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterator
+
+from generators import clients
+from generators.batch import map_concurrently, post_jobs, run_concurrently
+from generators.cache import ResponseCache
+from generators.prompts import PROMPTS, PromptRegistry, RenderedPrompt
+from generators.streaming import clean_stream
+from utils import metrics
+from utils.concurrency import get_concurrency_limiter
+from utils.rate_limiter import backoff_delay, get_limiter, is_rate_limit_error, retry_after_from_error
+from utils.singleflight import SingleFlight
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Общая для процесса группа объединения одинаковых запросов к Gemini
+_inflight = SingleFlight("gemini")
+
 
 class GeminiPostGenerator:
     """
     Класс для генерации текстового контента с помощью Google Cloud Gemini.
     """
 
-    def __init__(self, project_id: str, location: str, tone: str, topic: str):
+    provider = "gemini"
+
+    def __init__(self, project_id: str, location: str, tone: str, topic: str,
+                 model_name: str = "gemini-1.5-flash", cache: ResponseCache | None = None,
+                 gcs_bucket_name: str | None = None, storage_client=None, prompts: PromptRegistry | None = None):
         """
-        Инициализирует SDK Vertex AI и загружает модель Gemini.
+        Запоминает параметры генератора. SDK Vertex AI и модель Gemini
+        загружаются при первом запросе и общие для всех экземпляров.
 
         Args:
             project_id (str): ID проекта в Google Cloud.
             location (str): Регион для выполнения запросов.
             tone (str): Тон, в котором должен быть написан пост.
             topic (str): Тема поста.
+            model_name (str): Название используемой модели.
+            cache (ResponseCache | None): Кэш ответов (None — без кэширования).
+            gcs_bucket_name (str | None): Бакет для пакетного режима (тот же, что у ImagenGenerator).
+            storage_client (storage.Client | None): Готовый клиент GCS (по умолчанию — общий клиент проекта).
+            prompts (PromptRegistry | None): Реестр шаблонов запросов (по умолчанию — общий PROMPTS).
         """
         logger.info("Инициализация генератора текста Google Cloud Gemini...")
 
-        # Инициализация Vertex AI
-        vertexai.init(project=project_id, location=location)
-
+        self.project_id = project_id
+        self.location = location
         # Используем более быструю модель Gemini 1.5 Flash
-        self.model = GenerativeModel("gemini-1.5-flash")
+        self.model_name = model_name
         self.tone = tone
         self.topic = topic
+        self.cache = cache
+        self.prompts = prompts or PROMPTS
+        self.gcs_bucket_name = gcs_bucket_name
+        self._storage_client = storage_client
+        self.rate_limiter = get_limiter("gemini")
+        self.concurrency = get_concurrency_limiter("gemini")
         logger.info("Текстовый генератор готов к работе.")
 
-    def _generate_content(self, system_prompt: str, user_prompt: str, max_retries: int = 3) -> str | None:
+    def _generate_content(self, prompt: RenderedPrompt, max_retries: int = 3, refresh: bool = False) -> str | None:
         """
         Общий метод для генерации контента с обработкой ошибок и повторными попытками.
 
         Args:
-            system_prompt (str): Системная инструкция
-            user_prompt (str): Пользовательский запрос
+            prompt (RenderedPrompt): Запрос и параметры генерации из реестра шаблонов
             max_retries (int): Максимальное количество попыток
+            refresh (bool): Запросить новый ответ, минуя кэш и идущие одинаковые запросы
 
         Returns:
             str | None: Сгенерированный текст
         """
+        key = ResponseCache.make_key(self.model_name, prompt.system, prompt.user, prompt.temperature)
+        if refresh:
+            return self._request_content(prompt, key, max_retries)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Ответ взят из кэша")
+                return cached
+
+        # Одновременные одинаковые запросы (в том числе из других экземпляров) разделяют один вызов API
+        return _inflight.do(key, self._request_content, prompt, key, max_retries)
+
+    def _request_content(self, prompt: RenderedPrompt, cache_key: str, max_retries: int) -> str | None:
+        """
+        Запрос к API с повторными попытками; успешный ответ сохраняется в кэш.
+        """
         for attempt in range(max_retries):
+            if attempt:
+                metrics.inc("postgen_external_call_retries_total", provider="gemini")
             try:
-                response = self.model.generate_content(
-                    contents=[user_prompt],
-                    generation_config={
-                        "temperature": 0.7 if "описание" in system_prompt else 0.4,
-                        "max_output_tokens": 2048
-                    },
-                    system_instruction=system_prompt
-                )
+                self.rate_limiter.acquire()
+                with (
+                    self.concurrency.slot(),
+                    metrics.timer("postgen_external_call_seconds", provider="gemini", operation="generate_content")
+                ):
+                    response = self._model_for(prompt.system).generate_content(
+                        contents=[prompt.user],
+                        generation_config={
+                            "temperature": prompt.temperature,
+                            "max_output_tokens": prompt.max_tokens
+                        }
+                    )
+
+                usage = response.usage_metadata
+                if usage is not None:
+                    metrics.inc("postgen_llm_tokens_total", usage.prompt_token_count, provider="gemini", kind="prompt")
+                    metrics.inc("postgen_llm_tokens_total", usage.candidates_token_count, provider="gemini", kind="completion")
+                    # Токены общего префикса, взятые из неявного кэша контекста
+                    metrics.inc("postgen_llm_tokens_total", getattr(usage, "cached_content_token_count", 0) or 0,
+                                provider="gemini", kind="cached_prompt")
 
                 if response.text:
-                    return response.text.strip().strip('"')
+                    text = response.text.strip().strip('"')
+                    if self.cache is not None:
+                        self.cache.set(cache_key, text)
+                    return text
                 else:
                     logger.warning(f"Пустой ответ от Gemini (попытка {attempt + 1}/{max_retries})")
 
-            except ResourceExhausted:
-                wait_time = (attempt + 1) * 5  # Экспоненциальная задержка
-                logger.warning(f"Достигнут лимит квот. Повтор через {wait_time} сек...")
-                time.sleep(wait_time)
             except Exception as e:
-                logger.error(f"Ошибка генерации: {e}")
-                return None
+                # gRPC возвращает ResourceExhausted, REST-транспорт — TooManyRequests, у обоих code == 429
+                if is_rate_limit_error(e):
+                    wait_time = backoff_delay(attempt, retry_after=retry_after_from_error(e))
+                    logger.warning(f"Достигнут лимит квот. Повтор через {wait_time:.1f} сек...")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"Ошибка генерации: {e}")
+                    return None
 
         logger.error(f"Не удалось получить ответ после {max_retries} попыток")
         return None
 
-    def generate_post(self) -> str | None:
+    @property
+    def model(self):
+        """
+        Модель Gemini без системной инструкции.
+        """
+        clients.init_vertex(self.project_id, self.location)
+        return clients.get_generative_model(self.model_name)
+
+    def _model_for(self, system_prompt: str):
+        """
+        Возвращает модель с заданной системной инструкцией.
+        """
+        clients.init_vertex(self.project_id, self.location)
+        return clients.get_generative_model(self.model_name, system_prompt)
+
+    def _stream_content(self, prompt: RenderedPrompt, max_retries: int = 3) -> Iterator[str]:
+        """
+        Потоковый вариант _generate_content: выдаёт очищенные фрагменты ответа.
+
+        Повторные попытки выполняются только до получения первого фрагмента.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(self.model_name, prompt.system, prompt.user, prompt.temperature)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Ответ взят из кэша")
+                yield cached
+                return
+
+        for attempt in range(max_retries):
+            if attempt:
+                metrics.inc("postgen_external_call_retries_total", provider="gemini")
+            parts = []
+            try:
+                with self.concurrency.slot(track_latency=False):
+                    self.rate_limiter.acquire()
+                    started = time.perf_counter()
+                    stream = self._model_for(prompt.system).generate_content(
+                        contents=[prompt.user],
+                        generation_config={
+                            "temperature": prompt.temperature,
+                            "max_output_tokens": prompt.max_tokens
+                        },
+                        stream=True
+                    )
+
+                    for piece in clean_stream(self._stream_texts(stream, started)):
+                        parts.append(piece)
+                        yield piece
+
+                    if parts:
+                        if cache_key is not None:
+                            self.cache.set(cache_key, "".join(parts))
+                        return
+                    logger.warning(f"Пустой ответ от Gemini (попытка {attempt + 1}/{max_retries})")
+
+            except Exception as e:
+                if parts:
+                    # Часть ответа уже отдана потребителю: молча завершить поток значило бы вернуть обрезанный текст
+                    logger.error(f"Поток прерван после {len(parts)} фрагментов: {e}")
+                    raise
+                if is_rate_limit_error(e):
+                    wait_time = backoff_delay(attempt, retry_after=retry_after_from_error(e))
+                    logger.warning(f"Достигнут лимит квот. Повтор через {wait_time:.1f} сек...")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"Ошибка генерации: {e}")
+                    return
+
+        logger.error(f"Не удалось получить ответ после {max_retries} попыток")
+
+    @staticmethod
+    def _stream_texts(stream, started: float) -> Iterator[str]:
+        """
+        Извлекает текст из частичных ответов и учитывает время до первого фрагмента.
+        """
+        first = True
+        usage = None
+        for response in stream:
+            usage = response.usage_metadata or usage
+            try:
+                text = response.text
+            except ValueError:
+                # Частичный ответ без текста (например, только причина завершения)
+                continue
+            if not text:
+                continue
+            if first:
+                metrics.observe("postgen_first_chunk_seconds", time.perf_counter() - started, provider="gemini")
+                first = False
+            yield text
+        if usage is not None:
+            metrics.inc("postgen_llm_tokens_total", usage.prompt_token_count, provider="gemini", kind="prompt")
+            metrics.inc("postgen_llm_tokens_total", usage.candidates_token_count, provider="gemini", kind="completion")
+            metrics.inc("postgen_llm_tokens_total", getattr(usage, "cached_content_token_count", 0) or 0,
+                        provider="gemini", kind="cached_prompt")
+
+    def generate_post(self, topic: str | None = None, tone: str | None = None, refresh: bool = False) -> str | None:
         """
         Генерирует текст поста для социальных сетей.
+
+        Args:
+            topic (str | None): Тема поста (по умолчанию — заданная при создании)
+            tone (str | None): Тон поста (по умолчанию — заданный при создании)
+            refresh (bool): Сгенерировать новый текст, не читая кэш (например, взамен отклонённого)
         """
-        system_prompt = f"Ты высококвалифицированный SMM специалист, который генерирует тексты для постов. Тон сообщений: {self.tone}."
-        user_prompt = f"Сгенерируй пост для соцсетей на тему: '{self.topic}'. Пост должен быть привлекательным, содержательным и соответствовать тону {self.tone}."
+        topic = topic or self.topic
+        tone = tone or self.tone
+        prompt = self.prompts.render("post", topic=topic, tone=tone)
 
-        logger.info(f"Генерация поста: тема='{self.topic}', тон='{self.tone}'")
-        return self._generate_content(system_prompt, user_prompt)
+        logger.info(f"Генерация поста: тема='{topic}', тон='{tone}'")
+        return self._generate_content(prompt, refresh=refresh)
 
-    def generate_post_image_description(self) -> str | None:
+    def discard_post(self, topic: str | None = None, tone: str | None = None) -> None:
         """
-        Генерирует детализированный промпт для модели генерации изображений.
+        Удаляет из кэша текст поста для темы и тона, например отклонённый как дубликат.
+        """
+        if self.cache is None:
+            return
+        prompt = self.prompts.render("post", topic=topic or self.topic, tone=tone or self.tone)
+        self.cache.delete(ResponseCache.make_key(self.model_name, prompt.system, prompt.user, prompt.temperature))
+
+    def generate_post_stream(self, topic: str | None = None, tone: str | None = None) -> Iterator[str]:
+        """
+        Генерирует текст поста, выдавая фрагменты по мере их получения от модели.
+
+        Склейка фрагментов совпадает с результатом generate_post(). При ошибке
+        до первого фрагмента поток просто завершается, после него исключение
+        пробрасывается, чтобы обрезанный текст не приняли за полный.
+
+        Yields:
+            str: Очередной фрагмент текста
         """
-        system_prompt = (
-            "Ты — эксперт по созданию промптов для генерации изображений. Генерируй только англоязычные промпты для моделей типа Imagen или Midjourney. "
-            "Промпт должен включать: объект, окружение, стиль, освещение, детали. Пример: "
-            "'photo of a sleek, modern kitchen knife with Damascus steel pattern, resting on dark granite next to chopped vegetables, cinematic lighting, ultra-realistic, 8k'."
+        topic = topic or self.topic
+        tone = tone or self.tone
+        prompt = self.prompts.render("post", topic=topic, tone=tone)
+
+        logger.info(f"Потоковая генерация поста: тема='{topic}', тон='{tone}'")
+        yield from self._stream_content(prompt)
+
+    async def generate_posts(self, jobs: list[tuple[str, str]], concurrency: int = 8) -> list[str | None]:
+        """
+        Асинхронно генерирует посты для набора пар (тема, тон).
+
+        Args:
+            jobs (list[tuple[str, str]]): Список пар (тема, тон)
+            concurrency (int): Максимальное число одновременных запросов
+
+        Returns:
+            list[str | None]: Тексты постов в порядке заданий
+        """
+        logger.info(f"Пакетная генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return await run_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_many(self, topics: list[str], tones: str | list[str] | None = None,
+                           concurrency: int = 8) -> list[str | None]:
+        """
+        Генерирует посты для нескольких тем через один клиент и общий пул соединений.
+
+        Args:
+            topics (list[str]): Темы постов
+            tones (str | list[str] | None): Один тон на все темы, по тону на каждую
+                тему или None (тон, заданный при создании)
+            concurrency (int): Максимальное число одновременных запросов
+
+        Returns:
+            list[str | None]: Тексты постов в порядке тем
+        """
+        jobs = post_jobs(topics, tones, self.tone)
+        logger.info(f"Генерация {len(jobs)} постов (параллельно: {concurrency})")
+        return map_concurrently(self.generate_post, jobs, concurrency)
+
+    def generate_post_batch(self, topics: list[str], tones: str | list[str] | None = None,
+                            poll_interval: float = 60.0, timeout: float | None = None) -> Iterator[tuple[int, str | None]]:
+        """
+        Генерирует посты через пакетное предсказание Vertex AI (batch prediction).
+
+        Запросы записываются в JSONL в бакет gcs_bucket_name и отправляются одним
+        заданием: у пакетного режима отдельная, намного большая квота и более
+        низкая цена за токен. Готовые ответы выдаются по мере появления файлов
+        с результатами; ответы из кэша выдаются сразу и в задание не попадают.
+
+        Args:
+            topics (list[str]): Темы постов
+            tones (str | list[str] | None): Один тон на все темы, по тону на каждую
+                тему или None (тон, заданный при создании)
+            poll_interval (float): Период опроса состояния задания, сек
+            timeout (float | None): Максимальное время ожидания задания, сек
+
+        Yields:
+            tuple[int, str | None]: (номер темы, текст поста или None при ошибке)
+        """
+        if not self.gcs_bucket_name:
+            raise ValueError("Для пакетного режима нужен gcs_bucket_name")
+
+        pending = defaultdict(list)
+        lines = []
+        for index, (topic, tone) in enumerate(post_jobs(topics, tones, self.tone)):
+            prompt = self.prompts.render("post", topic=topic, tone=tone)
+            if self.cache is not None:
+                cached = self.cache.get(ResponseCache.make_key(self.model_name, prompt.system, prompt.user, prompt.temperature))
+                if cached is not None:
+                    yield index, cached
+                    continue
+            key = (prompt.system, prompt.user)
+            if key not in pending:
+                lines.append(json.dumps({"request": {
+                    "contents": [{"role": "user", "parts": [{"text": prompt.user}]}],
+                    "systemInstruction": {"parts": [{"text": prompt.system}]},
+                    "generationConfig": {"temperature": prompt.temperature, "maxOutputTokens": prompt.max_tokens}
+                }}, ensure_ascii=False))
+            pending[key].append((index, prompt.temperature))
+
+        if not lines:
+            return
+
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        clients.init_vertex(self.project_id, self.location)
+        storage_client = self._storage_client or clients.get_storage_client(self.project_id)
+        bucket = storage_client.bucket(self.gcs_bucket_name)
+        prefix = f"batch-prediction/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+        with metrics.timer("postgen_external_call_seconds", provider="gcs", operation="upload"):
+            bucket.blob(f"{prefix}/input.jsonl").upload_from_string(
+                "\n".join(lines) + "\n", content_type="application/jsonl"
+            )
+        logger.info(f"Пакетное задание: {len(lines)} запросов в gs://{self.gcs_bucket_name}/{prefix}/input.jsonl")
+
+        job = BatchPredictionJob.submit(
+            source_model=self.model_name,
+            input_dataset=f"gs://{self.gcs_bucket_name}/{prefix}/input.jsonl",
+            output_uri_prefix=f"gs://{self.gcs_bucket_name}/{prefix}/output"
         )
-        user_prompt = f"Создай промпт для генерации изображения на тему: '{self.topic}'."
+        logger.info(f"Пакетное задание отправлено: {job.resource_name}")
+
+        started = time.monotonic()
+        read = set()
+        while True:
+            job.refresh()
+            ended = job.has_ended
+            for blob in storage_client.list_blobs(self.gcs_bucket_name, prefix=f"{prefix}/output/"):
+                if blob.name in read or not blob.name.endswith(".jsonl"):
+                    continue
+                read.add(blob.name)
+                with metrics.timer("postgen_external_call_seconds", provider="gcs", operation="download"):
+                    content = blob.download_as_text()
+                for line in content.splitlines():
+                    yield from self._batch_results(line, pending)
+            if ended:
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                logger.error(f"Пакетное задание не завершилось за {timeout} сек")
+                break
+            time.sleep(poll_interval)
+
+        if not job.has_succeeded:
+            logger.error(f"Пакетное задание завершилось с ошибкой: {job.error}")
+        for entries in pending.values():
+            for index, _ in entries:
+                yield index, None
+
+    def _batch_results(self, line: str, pending: dict) -> Iterator[tuple[int, str | None]]:
+        """
+        Разбирает строку файла результатов и выдаёт ответ для всех тем с этим запросом.
+        """
+        if not line.strip():
+            return
+        record = json.loads(line)
+        request = record.get("request") or {}
+        try:
+            system_prompt = request["systemInstruction"]["parts"][0]["text"]
+            user_prompt = request["contents"][0]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            logger.warning("Строка результатов без исходного запроса пропущена")
+            return
+        entries = pending.pop((system_prompt, user_prompt), None)
+        if not entries:
+            return
+
+        response = record.get("response") or {}
+        usage = response.get("usageMetadata") or {}
+        metrics.inc("postgen_llm_tokens_total", usage.get("promptTokenCount", 0), provider="gemini", kind="prompt")
+        metrics.inc("postgen_llm_tokens_total", usage.get("candidatesTokenCount", 0), provider="gemini", kind="completion")
+        metrics.inc("postgen_llm_tokens_total", usage.get("cachedContentTokenCount", 0), provider="gemini", kind="cached_prompt")
+
+        text = None
+        candidates = response.get("candidates") or []
+        if candidates:
+            parts = (candidates[0].get("content") or {}).get("parts") or []
+            text = "".join(part.get("text", "") for part in parts).strip().strip('"') or None
+        if text is None:
+            logger.warning(f"Пустой ответ пакетного задания: {record.get('status') or 'нет кандидатов'}")
+
+        for index, temperature in entries:
+            if text is not None and self.cache is not None:
+                self.cache.set(ResponseCache.make_key(self.model_name, system_prompt, user_prompt, temperature), text)
+            yield index, text
+
+    def generate_post_image_description(self, topic: str | None = None) -> str | None:
+        """
+        Генерирует детализированный промпт для модели генерации изображений.
+
+        Args:
+            topic (str | None): Тема поста (по умолчанию — заданная при создании)
+        """
+        topic = topic or self.topic
+        prompt = self.prompts.render("image_prompt", topic=topic)
 
-        logger.info(f"Генерация промпта для изображения: тема='{self.topic}'")
-        return self._generate_content(system_prompt, user_prompt)
\ No newline at end of file
+        logger.info(f"Генерация промпта для изображения: тема='{topic}'")
+        return self._generate_content(prompt)
\ No newline at end of file
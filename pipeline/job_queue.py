@@ -0,0 +1,228 @@
+# pipeline/job_queue.py
+
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, fields
+
+logger = logging.getLogger(__name__)
+
+# Промежуточные результаты, которые сохраняются после каждого этапа
+CHECKPOINT_FIELDS = ("text", "image_prompt", "gcs_blob", "image_url", "vk_attachment", "vk_post_id")
+
+
+@dataclass
+class QueuedJob:
+    """
+    Задание из очереди вместе с сохранёнными результатами этапов.
+    """
+    id: int
+    topic: str
+    tone: str
+    status: str
+    attempts: int = 0
+    text: str | None = None
+    image_prompt: str | None = None
+    gcs_blob: str | None = None
+    image_url: str | None = None
+    vk_attachment: str | None = None
+    vk_post_id: int | None = None
+    error: str | None = None
+
+
+_COLUMNS = ", ".join(f.name for f in fields(QueuedJob))
+
+
+class LeaseLost(Exception):
+    """
+    Аренда задания истекла и задание взял другой воркер.
+    """
+
+
+class JobQueue:
+    """
+    Персистентная очередь заданий на подготовку постов в SQLite.
+
+    Задание выдаётся воркеру с арендой на lease_seconds. Если воркер упал и
+    аренда истекла, задание снова выдаётся и продолжается с первого этапа,
+    результат которого ещё не сохранён. Очередь безопасно использовать из
+    нескольких процессов: каждый открывает собственное соединение.
+    """
+
+    def __init__(self, db_path: str = "post_jobs.sqlite3", lease_seconds: float = 600.0):
+        """
+        Args:
+            db_path (str): Путь к файлу SQLite
+            lease_seconds (float): Время аренды задания воркером, сек
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "topic TEXT NOT NULL, tone TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'queued', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "text TEXT, image_prompt TEXT, gcs_blob TEXT, image_url TEXT, "
+            "vk_attachment TEXT, vk_post_id INTEGER, error TEXT, "
+            "lease_owner TEXT, lease_until REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)")
+
+    def close(self) -> None:
+        self._db.close()
+
+    def enqueue(self, topic: str, tone: str) -> int:
+        """
+        Добавляет задание в очередь и возвращает его id.
+        """
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO jobs (topic, tone, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (topic, tone, now, now)
+        )
+        return cursor.lastrowid
+
+    def enqueue_many(self, jobs: list[tuple[str, str]]) -> list[int]:
+        """
+        Добавляет пары (тема, тон) одной транзакцией.
+        """
+        now = time.time()
+        ids = []
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for topic, tone in jobs:
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (topic, tone, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (topic, tone, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        logger.info(f"В очередь добавлено заданий: {len(ids)}")
+        return ids
+
+    def claim(self, worker_id: str | None = None) -> QueuedJob | None:
+        """
+        Атомарно берёт в работу следующее задание: новое или с истёкшей арендой.
+
+        Returns:
+            QueuedJob | None: Задание или None, если брать нечего
+        """
+        worker_id = worker_id or _default_worker_id()
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                self._db.execute("COMMIT")
+                return None
+            job = QueuedJob(*row)
+            if job.status == "running":
+                logger.warning(f"Аренда задания {job.id} истекла, задание продолжается с сохранённых этапов")
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "lease_owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, job.id)
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        job.status = "running"
+        job.attempts += 1
+        return job
+
+    def checkpoint(self, job_id: int, worker_id: str | None = None, **values) -> None:
+        """
+        Сохраняет результаты этапов и продлевает аренду задания.
+
+        Raises:
+            LeaseLost: Задание больше не арендовано воркером worker_id
+        """
+        unknown = set(values) - set(CHECKPOINT_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        now = time.time()
+        assignments = "".join(f"{name} = ?, " for name in values)
+        cursor = self._db.execute(
+            f"UPDATE jobs SET {assignments}lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (*values.values(), now + self.lease_seconds, now, job_id, worker_id or _default_worker_id())
+        )
+        _check_lease(cursor, job_id)
+
+    def complete(self, job_id: int, worker_id: str | None = None) -> None:
+        self._finish(job_id, worker_id, "done", None)
+
+    def fail(self, job_id: int, error: str, max_attempts: int = 3, worker_id: str | None = None) -> bool:
+        """
+        Записывает ошибку. Пока попытки не исчерпаны, задание возвращается в очередь.
+
+        Returns:
+            bool: True, если задание будет выполнено повторно
+
+        Raises:
+            LeaseLost: Задание больше не арендовано воркером worker_id
+        """
+        attempts = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        retry = attempts < max_attempts
+        self._finish(job_id, worker_id, "queued" if retry else "failed", error)
+        return retry
+
+    def _finish(self, job_id: int, worker_id: str | None, status: str, error: str | None) -> None:
+        cursor = self._db.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (status, error, time.time(), job_id, worker_id or _default_worker_id())
+        )
+        _check_lease(cursor, job_id)
+
+    def get(self, job_id: int) -> QueuedJob | None:
+        row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return QueuedJob(*row) if row else None
+
+    def counts(self) -> dict[str, int]:
+        """
+        Число заданий по статусам.
+        """
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def has_unfinished(self) -> bool:
+        """
+        Есть ли задания в очереди или в работе.
+        """
+        row = self._db.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone()
+        return row is not None
+
+    def next_claimable_at(self) -> float | None:
+        """
+        Когда claim() сможет взять задание (unix time): сейчас, если есть
+        задания в очереди, иначе момент истечения ближайшей аренды.
+        None — незавершённых заданий нет.
+        """
+        if self._db.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is not None:
+            return time.time()
+        row = self._db.execute("SELECT MIN(lease_until) FROM jobs WHERE status = 'running'").fetchone()
+        return row[0]
+
+
+def _default_worker_id() -> str:
+    return f"pid-{os.getpid()}"
+
+
+def _check_lease(cursor: sqlite3.Cursor, job_id: int) -> None:
+    # Ни одна строка не изменилась: аренда истекла и задание забрал другой воркер
+    if cursor.rowcount == 0:
+        raise LeaseLost(f"Задание {job_id} больше не арендовано этим воркером")
@@ -0,0 +1,194 @@
+# pipeline/post_pipeline.py
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from generators.dedup import NearDuplicateIndex
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PostJob:
+    """
+    Задание на подготовку одного поста.
+    """
+    topic: str
+    tone: str
+
+
+@dataclass
+class PostResult:
+    """
+    Результат прохождения поста через конвейер.
+    """
+    job: PostJob
+    text: str | None = None
+    image_prompt: str | None = None
+    image: bytes | None = None
+    response: dict | None = None
+    error: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+class PostPipeline:
+    """
+    Конвейер подготовки постов в виде графа зависимостей.
+
+    Текст поста и промпт для изображения генерируются параллельно, генерация
+    изображения стартует сразу после готовности промпта, а публикация ждёт
+    и текст, и изображение. Каждый этап выполняется в своём ограниченном пуле
+    потоков, время этапов записывается в PostResult.timings.
+    """
+
+    def __init__(self, text_generator, image_generator, publisher=None,
+                 text_workers: int = 8, image_workers: int = 2, publish_workers: int = 2,
+                 dedup: NearDuplicateIndex | None = None, max_regenerations: int = 2):
+        """
+        Args:
+            text_generator: DeepSeekPostGenerator или GeminiPostGenerator
+            image_generator (ImagenGenerator): Генератор изображений
+            publisher (VKPublisher | None): Публикатор (None — без публикации)
+            text_workers (int): Размер пула для текстовых запросов
+            image_workers (int): Размер пула для генерации изображений
+            publish_workers (int): Размер пула для публикации
+            dedup (NearDuplicateIndex | None): Индекс прошлых постов; почти дубликаты
+                генерируются заново, а если не помогло — пост не публикуется
+            max_regenerations (int): Число повторных генераций при найденном дубликате
+        """
+        self.text_generator = text_generator
+        self.image_generator = image_generator
+        self.publisher = publisher
+        self.dedup = dedup
+        self.max_regenerations = max_regenerations
+        self.text_workers = text_workers
+        self.image_workers = image_workers
+        self.publish_workers = publish_workers
+
+    def run(self, jobs: list[PostJob]) -> list[PostResult]:
+        """
+        Прогоняет все задания через конвейер.
+
+        Returns:
+            list[PostResult]: Результаты в порядке заданий
+        """
+        logger.info(f"Запуск конвейера для {len(jobs)} постов")
+        started = time.perf_counter()
+        results = [PostResult(job=job) for job in jobs]
+
+        with ThreadPoolExecutor(self.text_workers, thread_name_prefix="pipeline-text") as text_pool, \
+                ThreadPoolExecutor(self.image_workers, thread_name_prefix="pipeline-image") as image_pool, \
+                ThreadPoolExecutor(self.publish_workers, thread_name_prefix="pipeline-publish") as publish_pool:
+            final = [self._schedule(result, text_pool, image_pool, publish_pool) for result in results]
+            wait(final)
+
+        duration = time.perf_counter() - started
+        failed = sum(1 for result in results if result.error)
+        logger.info(f"Конвейер завершён за {duration:.2f} сек: {len(results) - failed} успешно, {failed} с ошибками")
+        return results
+
+    def _schedule(self, result: PostResult, text_pool, image_pool, publish_pool) -> Future:
+        job = result.job
+
+        text_future = text_pool.submit(
+            self._stage, result, "text", "text",
+            self._generate_text, job.topic, job.tone
+        )
+        prompt_future = text_pool.submit(
+            self._stage, result, "image_prompt", "image_prompt",
+            self.text_generator.generate_post_image_description, job.topic
+        )
+        image_future = _then([prompt_future], image_pool, lambda: self._stage(
+            result, "image", "image", self.image_generator.generate_image_bytes, result.image_prompt
+        ))
+
+        if self.publisher is None:
+            return _then([text_future, image_future], publish_pool, lambda: None)
+        return _then([text_future, image_future], publish_pool, lambda: self._stage(
+            result, "publish", "response", self._publish, result.text, image=result.image
+        ))
+
+    def _publish(self, text: str, image: bytes | None = None) -> dict:
+        """
+        Публикует пост; ответ VK с ошибкой превращается в исключение.
+        """
+        response = self.publisher.publish_post(text, image=image)
+        if 'error' in response:
+            raise RuntimeError(response['error'].get('error_msg', response['error']))
+        return response
+
+    def _generate_text(self, topic: str, tone: str) -> str | None:
+        """
+        Генерирует текст поста, отбрасывая почти дубликаты уже опубликованных.
+        """
+        for attempt in range(self.max_regenerations + 1):
+            # Повторная генерация минует кэш, иначе вернулся бы тот же отклонённый текст
+            text = self.text_generator.generate_post(topic, tone, refresh=attempt > 0)
+            if text is None or self.dedup is None:
+                return text
+            match = self.dedup.add_if_unique(text)
+            if match is None:
+                return text
+            self.text_generator.discard_post(topic, tone)
+            logger.warning(
+                f"Почти дубликат ('{topic}', сходство {match[1]:.2f}), "
+                f"попытка {attempt + 1}/{self.max_regenerations + 1}"
+            )
+            metrics.inc("postgen_duplicates_total")
+        return None
+
+    @staticmethod
+    def _stage(result: PostResult, name: str, attr: str, func: Callable, *args, **kwargs) -> None:
+        """
+        Выполняет этап, если предыдущие этапы прошли успешно, и замеряет его время.
+        """
+        if result.error:
+            return
+        if any(arg is None for arg in args):
+            result.error = f"этап '{name}' пропущен: нет входных данных"
+            return
+
+        started = time.perf_counter()
+        try:
+            value = func(*args, **kwargs)
+        except Exception as e:
+            value = None
+            result.error = f"этап '{name}': {e}"
+            logger.error(f"Ошибка на этапе '{name}' ('{result.job.topic}'): {e}")
+        result.timings[name] = time.perf_counter() - started
+
+        if value is None:
+            result.error = result.error or f"этап '{name}' не вернул результат"
+            return
+        setattr(result, attr, value)
+
+
+def _then(dependencies: list[Future], pool: ThreadPoolExecutor, func: Callable[[], Any]) -> Future:
+    """
+    Запускает func в пуле, как только завершатся все зависимости.
+    """
+    future = Future()
+    remaining = [len(dependencies)]
+    lock = threading.Lock()
+
+    def run():
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            ready = remaining[0] == 0
+        if ready:
+            pool.submit(run)
+
+    for dependency in dependencies:
+        dependency.add_done_callback(on_done)
+    return future
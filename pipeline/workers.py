@@ -0,0 +1,168 @@
+# pipeline/workers.py
+
+import logging
+import multiprocessing
+import os
+import time
+from typing import Callable
+
+from pipeline.job_queue import JobQueue, LeaseLost, QueuedJob
+
+logger = logging.getLogger(__name__)
+
+
+def process_job(queue: JobQueue, job: QueuedJob, text_generator, image_generator, publisher=None,
+                worker_id: str | None = None) -> None:
+    """
+    Выполняет недостающие этапы задания, сохраняя результат каждого из них.
+
+    Уже сохранённые этапы пропускаются, поэтому после сбоя повторно
+    оплачиваются только генерации, которые не успели завершиться.
+    Если аренду перехватил другой воркер, сохранение поднимает LeaseLost.
+    """
+    if job.text is None:
+        job.text = _require("text", text_generator.generate_post(job.topic, job.tone))
+        queue.checkpoint(job.id, worker_id, text=job.text)
+
+    if job.image_prompt is None:
+        job.image_prompt = _require("image_prompt", text_generator.generate_post_image_description(job.topic))
+        queue.checkpoint(job.id, worker_id, image_prompt=job.image_prompt)
+
+    if job.gcs_blob is None:
+        result = image_generator.generate_images([job.image_prompt])[0]
+        if not result.images:
+            raise RuntimeError(f"этап 'image' не вернул результат: {result.error}")
+        job.gcs_blob, job.image_url = result.images[0].blob_name, result.images[0].signed_url
+        queue.checkpoint(job.id, worker_id, gcs_blob=job.gcs_blob, image_url=job.image_url)
+
+    if publisher is None:
+        return
+
+    if job.vk_attachment is None:
+        # Signed URL мог истечь, пока задание ждало перезапуска, поэтому читаем сам объект
+        image = image_generator.download_image(job.gcs_blob)
+        job.vk_attachment = publisher.upload_photo(image)
+        queue.checkpoint(job.id, worker_id, vk_attachment=job.vk_attachment)
+
+    if job.vk_post_id is None:
+        response = publisher.publish_post(job.text, attachment=job.vk_attachment)
+        if 'error' in response:
+            raise RuntimeError(response['error'].get('error_msg', response['error']))
+        job.vk_post_id = response['response']['post_id']
+        queue.checkpoint(job.id, worker_id, vk_post_id=job.vk_post_id)
+
+
+def _require(stage: str, value):
+    if value is None:
+        raise RuntimeError(f"этап '{stage}' не вернул результат")
+    return value
+
+
+def work(db_path: str, factory: Callable, max_attempts: int = 3, lease_seconds: float = 600.0) -> int:
+    """
+    Цикл воркера: берёт задания из очереди, пока они есть.
+
+    Args:
+        db_path (str): Путь к базе очереди
+        factory (Callable): Функция без аргументов, возвращающая
+            (text_generator, image_generator, publisher | None)
+        max_attempts (int): Максимальное число попыток на задание
+        lease_seconds (float): Время аренды задания, сек
+
+    Returns:
+        int: Число обработанных заданий
+    """
+    queue = JobQueue(db_path, lease_seconds=lease_seconds)
+    text_generator, image_generator, publisher = factory()
+    worker_id = f"pid-{os.getpid()}"
+    processed = 0
+
+    try:
+        while (job := queue.claim(worker_id)) is not None:
+            try:
+                if job.attempts > max_attempts:
+                    # Воркер падал на этом задании, не успевая записать ошибку
+                    queue.fail(job.id, job.error or "превышено число попыток", max_attempts, worker_id)
+                    continue
+                logger.info(f"[{worker_id}] Задание {job.id}: '{job.topic}' (попытка {job.attempts})")
+                try:
+                    process_job(queue, job, text_generator, image_generator, publisher, worker_id)
+                except LeaseLost:
+                    raise
+                except Exception as e:
+                    retry = queue.fail(job.id, str(e), max_attempts, worker_id)
+                    logger.error(f"[{worker_id}] Задание {job.id}: {e}" + (" — будет повторено" if retry else ""))
+                else:
+                    queue.complete(job.id, worker_id)
+            except LeaseLost as e:
+                # Задание продолжает новый владелец аренды, его результаты не перезаписываются
+                logger.warning(f"[{worker_id}] {e}, задание прервано")
+                continue
+            processed += 1
+    finally:
+        queue.close()
+    return processed
+
+
+def run_workers(db_path: str, factory: Callable, processes: int | None = None, max_attempts: int = 3,
+                lease_seconds: float = 600.0, poll_interval: float = 1.0) -> dict[str, int]:
+    """
+    Запускает пул процессов-воркеров и ждёт, пока очередь не опустеет.
+
+    Упавшие процессы перезапускаются; их задания подхватываются после
+    истечения аренды. factory должна быть функцией уровня модуля, чтобы её
+    можно было передать в дочерний процесс.
+
+    Args:
+        db_path (str): Путь к базе очереди
+        factory (Callable): Фабрика генераторов и публикатора для каждого процесса
+        processes (int | None): Число процессов (по умолчанию — число ядер)
+        max_attempts (int): Максимальное число попыток на задание
+        lease_seconds (float): Время аренды задания, сек
+        poll_interval (float): Период проверки состояния процессов, сек
+
+    Returns:
+        dict[str, int]: Итоговое число заданий по статусам
+    """
+    processes = processes or os.cpu_count() or 1
+    args = (db_path, factory, max_attempts, lease_seconds)
+    queue = JobQueue(db_path, lease_seconds=lease_seconds)
+
+    def spawn():
+        process = multiprocessing.Process(target=work, args=args, daemon=True)
+        process.start()
+        return process
+
+    logger.info(f"Запуск {processes} воркеров для очереди {db_path}")
+    workers = [spawn() for _ in range(processes)]
+    try:
+        while True:
+            time.sleep(poll_interval)
+            alive = []
+            for process in workers:
+                if process.is_alive():
+                    alive.append(process)
+                elif process.exitcode != 0:
+                    logger.warning(f"Воркер {process.pid} завершился с кодом {process.exitcode}, перезапуск")
+                    alive.append(spawn())
+            workers = alive
+            if workers:
+                continue
+            claimable_at = queue.next_claimable_at()
+            if claimable_at is None:
+                break
+            # Задания упавших воркеров освобождаются только после истечения аренды:
+            # воркер, запущенный раньше, ничего не возьмёт и сразу завершится
+            delay = claimable_at - time.time()
+            if delay > 0:
+                logger.info(f"Ожидание истечения аренды: {delay:.1f} сек")
+                time.sleep(delay)
+            workers = [spawn()]
+        counts = queue.counts()
+    finally:
+        for process in workers:
+            process.terminate()
+        queue.close()
+
+    logger.info(f"Очередь обработана: {counts}")
+    return counts
@@ -1,57 +1,336 @@
-import requests
+import datetime
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from utils import metrics
+from utils.http import DEFAULT_TIMEOUT, get_session
+from utils.rate_limiter import get_limiter
+from utils.vk import VK_API_URL, VKAPIError, call_method, execute_code, execute_parallel
+from utils.vk_async import AsyncVKClient
+
+
+@dataclass
+class ScheduledPost:
+    """
+    Пост для пакетной публикации.
+
+    images — URL, пути, байты или потоки; publish_date — время отложенной
+    публикации (datetime или unix time), None — опубликовать сразу;
+    group_id — сообщество (по умолчанию сообщество публикатора).
+    """
+    message: str
+    images: list = field(default_factory=list)
+    publish_date: datetime.datetime | int | None = None
+    group_id: int | None = None
+
 
 class VKPublisher:
-    def __init__(self, vk_api_key, group_id):
+    def __init__(self, vk_api_key, group_id, session=None, timeout=DEFAULT_TIMEOUT, api_url=VK_API_URL):
         self.vk_api_key = vk_api_key
         self.group_id = group_id
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.api_url = api_url.rstrip('/')
+        self.rate_limiter = get_limiter('vk')
+
+    def upload_photo(self, image):
+        """
+        Загружает фото на стену сообщества.
+
+        image может быть URL, путём к файлу, байтами или открытым бинарным потоком.
+        Файлы и потоки отправляются на сервер загрузки VK без полной копии в памяти.
+        """
+        upload_url = self._call('photos.getWallUploadServer', {'group_id': self.group_id})['upload_url']
+        upload_response = self._upload_file(upload_url, image)
+
+        saved = self._call('photos.saveWallPhoto', {
+            'group_id': self.group_id,
+            'photo': upload_response['photo'],
+            'server': upload_response['server'],
+            'hash': upload_response['hash']
+        })[0]
+        return f"photo{saved['owner_id']}_{saved['id']}"
+
+    def _upload_file(self, upload_url, image):
+        """
+        Отправляет изображение на сервер загрузки VK и возвращает его ответ.
+        """
+        fileobj, size, close = self._open_image(image)
+        try:
+            body = _MultipartFile('photo', 'image.jpg', fileobj, size)
+            with metrics.timer('postgen_external_call_seconds', provider='vk', operation='upload'):
+                upload_response = self.session.post(
+                    upload_url,
+                    data=body,
+                    headers={'Content-Type': body.content_type},
+                    timeout=self.timeout
+                ).json()
+            metrics.inc('postgen_uploaded_bytes_total', size, target='vk')
+        finally:
+            close()
+        if 'error' in upload_response or not upload_response.get('photo'):
+            raise Exception(f"Сервер загрузки не принял фото: {upload_response.get('error', upload_response)}")
+        return upload_response
+
+    def _open_image(self, image):
+        """
+        Возвращает (поток, размер, функция закрытия) для источника изображения.
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return BytesIO(image), len(image), lambda: None
+
+        if isinstance(image, str) and image.startswith(('http://', 'https://')):
+            response = self.session.get(image, stream=True, timeout=self.timeout)
+            response.raise_for_status()
+            length = response.headers.get('Content-Length')
+            if length is None or response.headers.get('Content-Encoding'):
+                data = response.content
+                return BytesIO(data), len(data), response.close
+            return response.raw, int(length), response.close
+
+        if isinstance(image, (str, os.PathLike)):
+            fileobj = open(image, 'rb')
+            return fileobj, os.fstat(fileobj.fileno()).st_size, fileobj.close
+
+        if hasattr(image, 'read'):
+            if hasattr(image, 'seekable') and image.seekable():
+                position = image.tell()
+                size = image.seek(0, os.SEEK_END) - position
+                image.seek(position)
+                return image, size, lambda: None
+            data = image.read()
+            return BytesIO(data), len(data), lambda: None
+
+        raise TypeError(f'Неподдерживаемый источник изображения: {type(image).__name__}')
+
+    def publish_post(self, content, image_url=None, image=None, attachment=None):
+        """
+        Публикует пост на стене сообщества.
+
+        attachment — уже загруженное фото вида photo<owner>_<id>, например
+        сохранённое после upload_photo; в этом случае изображение не загружается.
+        """
+        params = {
+            'from_group': 1,
+            'owner_id': f'-{self.group_id}',
+            'message': content
+        }
+        source = image if image is not None else image_url
+        if attachment is not None:
+            params['attachments'] = attachment
+        elif source is not None:
+            attachment = self.upload_photo(source)
+            params['attachments'] = attachment
+
+        try:
+            return {'response': self._call('wall.post', params, post=True)}
+        except VKAPIError as e:
+            # Вызывающий код проверяет поле error, как в ответе VK
+            return {'error': {'error_code': e.code, 'error_msg': e.message}}
+
+    def publish_batch(self, posts, max_workers=8):
+        """
+        Публикует или планирует несколько постов за минимальное число запросов.
+
+        Адреса серверов загрузки для всех сообществ запрашиваются одним execute,
+        фото всех постов загружаются параллельно, а photos.saveWallPhoto
+        и wall.post упаковываются пачками по 25 в execute.
+
+        Args:
+            posts (list[ScheduledPost]): Посты с фото и временем публикации
+            max_workers (int): Число параллельных загрузок фото
+
+        Returns:
+            list[dict]: Для каждого поста {'post_id': ...} или {'error': ...}
+        """
+        results = [{} for _ in posts]
+        if not posts:
+            return results
+        # id сообществ из конфигурации могут быть строками
+        post_groups = [int(post.group_id or self.group_id) for post in posts]
 
-    def upload_photo(self, image_url):
-        upload_url_response = requests.get(
-            'https://api.vk.com/method/photos.getWallUploadServer',
-            params={
-                'access_token': self.vk_api_key,
-                'v': '5.236',
-                'group_id': self.group_id
+        # 1. Серверы загрузки — по одному на сообщество
+        groups = sorted({group for group, post in zip(post_groups, posts) if post.images})
+        upload_urls = {}
+        if groups:
+            servers = self._execute([('photos.getWallUploadServer', {'group_id': group}) for group in groups])
+            upload_urls = {group: server['upload_url'] for group, server in zip(groups, servers) if server}
+
+        # 2. Параллельная загрузка всех фото
+        uploads = [
+            (index, post_groups[index], image)
+            for index, post in enumerate(posts) for image in post.images
+        ]
+
+        def upload(item):
+            index, group, image = item
+            if group not in upload_urls:
+                raise Exception(f'Нет сервера загрузки для сообщества {group}')
+            return self._upload_file(upload_urls[group], image)
+
+        saves, owners = [], []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(uploads)))) as pool:
+            futures = [pool.submit(upload, item) for item in uploads]
+            for (index, group, _), future in zip(uploads, futures):
+                try:
+                    uploaded = future.result()
+                except Exception as e:
+                    results[index].setdefault('error', str(e))
+                    continue
+                saves.append(('photos.saveWallPhoto', {
+                    'group_id': group,
+                    'photo': uploaded['photo'],
+                    'server': uploaded['server'],
+                    'hash': uploaded['hash']
+                }))
+                owners.append(index)
+
+        # 3. Сохранение фото пачками через execute
+        attachments = [[] for _ in posts]
+        for index, saved in zip(owners, self._execute(saves)):
+            if saved:
+                attachments[index].append(f"photo{saved[0]['owner_id']}_{saved[0]['id']}")
+            else:
+                results[index].setdefault('error', 'photos.saveWallPhoto не выполнен')
+
+        # 4. Публикация и планирование постов пачками через execute
+        calls, indexes = [], []
+        for index, post in enumerate(posts):
+            if 'error' in results[index]:
+                continue
+            params = {
+                'owner_id': -post_groups[index],
+                'from_group': 1,
+                'message': post.message
             }
-        ).json()
-
-        if 'error' in upload_url_response:
-            raise Exception(upload_url_response['error']['error_msg'])
-        else:
-            upload_url = upload_url_response['response']['upload_url']
-            image_data = requests.get(image_url).content
-            upload_response = requests.post(upload_url, files={'photo': ('image.jpg', image_data)}).json()
-
-            save_response = requests.get(
-                'https://api.vk.com/method/photos.saveWallPhoto',
-                params={
-                    'access_token': self.vk_api_key,
-                    'v': '5.236',
-                    'group_id': self.group_id,
-                    'photo': upload_response['photo'],
-                    'server': upload_response['server'],
-                    'hash': upload_response['hash']
-                }
-            ).json()
-
-            photo_id = save_response['response'][0]['id']
-            owner_id = save_response['response'][0]['owner_id']
-
-            return f'photo{owner_id}_{photo_id}'
-
-    def publish_post(self, content, image_url=None):
+            if attachments[index]:
+                params['attachments'] = ','.join(attachments[index])
+            if post.publish_date is not None:
+                params['publish_date'] = _unix_time(post.publish_date)
+            calls.append(('wall.post', params))
+            indexes.append(index)
+
+        for index, posted in zip(indexes, self._execute(calls)):
+            if posted:
+                results[index] = {'post_id': posted['post_id']}
+            else:
+                results[index] = {'error': 'wall.post не выполнен'}
+        return results
+
+    def _execute(self, calls, max_workers=4):
+        """
+        Выполняет вызовы пачками через execute; неудачные вызовы возвращаются как False.
+        """
+        return execute_parallel(self._execute_batch, calls, max_workers)
+
+    def _execute_batch(self, calls):
+        return self._call('execute', {'code': execute_code(calls)}, post=True)
+
+    def _call(self, method, params, post=False):
+        return call_method(
+            self.session, self.api_url, method, params, self.vk_api_key, self.rate_limiter, self.timeout, post=post
+        )
+
+
+class AsyncVKPublisher:
+    """
+    Асинхронный вариант VKPublisher поверх AsyncVKClient.
+
+    Публикаторы разных сообществ могут разделять один клиент, тогда все они
+    используют общий пул соединений и общий цикл событий.
+    """
+
+    def __init__(self, vk_api_key, group_id, client=None, api_url=VK_API_URL):
+        self.vk_api_key = vk_api_key
+        self.group_id = group_id
+        self._owns_client = client is None
+        self.client = client or AsyncVKClient(api_url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def upload_photo(self, image):
+        """
+        Загружает фото на стену сообщества и возвращает вложение вида photo<owner>_<id>.
+        """
+        server = await self.client.call('photos.getWallUploadServer', {'group_id': self.group_id}, self.vk_api_key)
+        uploaded = await self.client.upload(server['upload_url'], image)
+        saved = await self.client.call('photos.saveWallPhoto', {
+            'group_id': self.group_id,
+            'photo': uploaded['photo'],
+            'server': uploaded['server'],
+            'hash': uploaded['hash']
+        }, self.vk_api_key)
+        return f"photo{saved[0]['owner_id']}_{saved[0]['id']}"
+
+    async def publish_post(self, content, image_url=None, image=None, attachment=None):
+        """
+        Публикует пост на стене сообщества.
+
+        Возвращает ответ в том же виде, что VKPublisher.publish_post
+        ({'response': {'post_id': ...}}); ошибки VK поднимают VKAPIError.
+        """
         params = {
-            'access_token': self.vk_api_key,
             'from_group': 1,
-            'v': '5.236',
             'owner_id': f'-{self.group_id}',
             'message': content
         }
-        if image_url:
-            attachment = self.upload_photo(image_url)
+        source = image if image is not None else image_url
+        if attachment is None and source is not None:
+            attachment = await self.upload_photo(source)
+        if attachment is not None:
             params['attachments'] = attachment
 
-        response = requests.post('https://api.vk.com/method/wall.post', params=params).json()
-        return response
+        return {'response': await self.client.call('wall.post', params, self.vk_api_key, post=True)}
+
+
+def _unix_time(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.astimezone()
+        return int(value.timestamp())
+    return int(value)
+
+
+class _MultipartFile:
+    """
+    Потоковое тело multipart/form-data с одним файлом.
+
+    requests читает его порциями и отправляет с известным Content-Length,
+    поэтому файл не собирается в памяти целиком.
+    """
+
+    def __init__(self, field_name, filename, fileobj, size):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        self._parts = [BytesIO(head), fileobj, BytesIO(tail)]
+        self.len = len(head) + size + len(tail)
 
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size if size >= 0 else -1)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size >= 0:
+                size -= len(chunk)
+        return b''.join(chunks)
 
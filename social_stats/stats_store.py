@@ -0,0 +1,180 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DAY = datetime.timedelta(days=1)
+
+
+class StatsStore:
+    """
+    Локальное хранилище дневной статистики сообществ VK.
+
+    Данные хранятся в SQLite с ключом (group_id, day). У VK запрашиваются только
+    отсутствующие дни и последние refresh_days дней, которые ещё могут меняться.
+    """
+
+    def __init__(self, vk_stats, db_path='vk_stats.sqlite3', refresh_days=2):
+        """
+        Args:
+            vk_stats (VKStats): Клиент для загрузки недостающих данных
+            db_path (str): Путь к файлу базы SQLite
+            refresh_days (int): Сколько последних дней всегда перезапрашивать
+        """
+        self.vk_stats = vk_stats
+        self.refresh_days = refresh_days
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS daily_stats ('
+            'group_id INTEGER NOT NULL, day TEXT NOT NULL, data TEXT NOT NULL, fetched_at REAL NOT NULL, '
+            'PRIMARY KEY (group_id, day))'
+        )
+        self._db.commit()
+
+    def get_range(self, group_ids, start_date, end_date):
+        """
+        Возвращает статистику по дням за период [start_date, end_date].
+
+        Returns:
+            dict: {group_id: [{'day': 'YYYY-MM-DD', ...данные VK}, ...]}
+        """
+        group_ids = _normalize_ids(group_ids)
+        start = _parse_day(start_date)
+        end = _parse_day(end_date)
+        self.sync(group_ids, start, end)
+
+        result = {group_id: [] for group_id in group_ids}
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT group_id, day, data FROM daily_stats '
+                f'WHERE group_id IN ({_placeholders(group_ids)}) AND day BETWEEN ? AND ? '
+                f'ORDER BY group_id, day',
+                (*group_ids, start.isoformat(), end.isoformat())
+            ).fetchall()
+        for group_id, day, data in rows:
+            result[group_id].append(dict(json.loads(data), day=day))
+        return result
+
+    def aggregate(self, group_ids, start_date, end_date, field, func='sum'):
+        """
+        Агрегирует поле статистики по дням, например field='visitors.views'.
+
+        Args:
+            func (str): Агрегатная функция SQLite: sum, avg, min, max или count
+
+        Returns:
+            dict: {group_id: значение}
+        """
+        if func not in ('sum', 'avg', 'min', 'max', 'count'):
+            raise ValueError(f'Неподдерживаемая агрегатная функция: {func}')
+
+        group_ids = _normalize_ids(group_ids)
+        start = _parse_day(start_date)
+        end = _parse_day(end_date)
+        self.sync(group_ids, start, end)
+
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT group_id, {func}(json_extract(data, ?)) FROM daily_stats '
+                f'WHERE group_id IN ({_placeholders(group_ids)}) AND day BETWEEN ? AND ? '
+                f'GROUP BY group_id',
+                (f'$.{field}', *group_ids, start.isoformat(), end.isoformat())
+            ).fetchall()
+        result = {group_id: None for group_id in group_ids}
+        result.update(dict(rows))
+        return result
+
+    def sync(self, group_ids, start, end):
+        """
+        Загружает у VK недостающие и ещё изменяющиеся дни периода [start, end].
+        """
+        ranges = []
+        for group_id in _normalize_ids(group_ids):
+            for missing_start, missing_end in self._missing_ranges(group_id, start, end):
+                ranges.append((group_id, _to_utc(missing_start), _to_utc(missing_end + DAY)))
+        if not ranges:
+            return
+
+        logger.info(f'Загрузка статистики VK: {len(ranges)} диапазонов')
+        windows = self.vk_stats.get_daily_windows(ranges)
+
+        fetched_at = time.time()
+        rows = []
+        for group_id, window_start, window_end, periods in windows:
+            if periods is None:
+                # Неудачное окно не сохраняется и будет запрошено при следующей синхронизации
+                logger.warning(
+                    f'Статистика сообщества {group_id} за {window_start.date()}—{window_end.date()} не получена'
+                )
+                continue
+            # Дни без данных в успешном окне тоже сохраняются, чтобы не запрашивать их повторно
+            days = {}
+            day = window_start.date()
+            while day < window_end.date():
+                days[day.isoformat()] = {}
+                day += DAY
+            for period in periods:
+                day = datetime.datetime.fromtimestamp(period['period_from'], datetime.timezone.utc).date().isoformat()
+                if day in days:
+                    days[day] = period
+            rows.extend(
+                (group_id, day, json.dumps(data, ensure_ascii=False), fetched_at)
+                for day, data in days.items()
+            )
+
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO daily_stats (group_id, day, data, fetched_at) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self._db.commit()
+
+    def _missing_ranges(self, group_id, start, end):
+        """
+        Возвращает непрерывные диапазоны дней, которые нужно запросить у VK.
+        """
+        with self._lock:
+            stored = {
+                row[0] for row in self._db.execute(
+                    'SELECT day FROM daily_stats WHERE group_id = ? AND day BETWEEN ? AND ?',
+                    (group_id, start.isoformat(), end.isoformat())
+                )
+            }
+        stale_from = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=self.refresh_days)
+
+        ranges = []
+        day = start
+        while day <= end:
+            if day.isoformat() not in stored or day > stale_from:
+                if ranges and ranges[-1][1] == day - DAY:
+                    ranges[-1][1] = day
+                else:
+                    ranges.append([day, day])
+            day += DAY
+        return [tuple(r) for r in ranges]
+
+
+def _parse_day(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _to_utc(day):
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc)
+
+
+def _normalize_ids(group_ids):
+    # id сообществ из конфигурации могут быть строками, а в базе они INTEGER
+    return [int(group_id) for group_id in group_ids]
+
+
+def _placeholders(values):
+    return ','.join('?' * len(values))
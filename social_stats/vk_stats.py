@@ -1,13 +1,20 @@
-import requests
 import datetime
 
+from utils.http import DEFAULT_TIMEOUT, get_session
+from utils.rate_limiter import get_limiter
+from utils.vk import VK_API_URL, call_method, execute_code, execute_parallel
+from utils.vk_async import AsyncVKClient
+
 class VKStats:
-    def __init__(self, vk_api_key, group_id):
+    def __init__(self, vk_api_key, group_id, session=None, timeout=DEFAULT_TIMEOUT, api_url=VK_API_URL):
         self.vk_api_key = vk_api_key
         self.group_id = group_id
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.api_url = api_url.rstrip('/')
+        self.rate_limiter = get_limiter('vk')
 
     def get_stats(self, start_date, end_date):
-        url = 'https://api.vk.com/method/stats.get'
         start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
         end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
 
@@ -18,27 +25,156 @@ class VKStats:
         end_unix_time = end_date.timestamp()
 
         params = {
-            'access_token': self.vk_api_key,
-            'v': '5.236',
             'group_id': self.group_id,
             'timestamp_from': start_unix_time,
             'timestamp_to': end_unix_time
         }
-        response = requests.get(url, params=params).json()
-        if 'error' in response:
-            raise Exception(response['error']['error_msg'])
-        else:
-            return response['response'][0]
+        return self._call('stats.get', params)[0]
 
     def get_followers(self):
-        url = 'https://api.vk.com/method/groups.getMembers'
-        params = {
-            'access_token': self.vk_api_key,
-            'v': '5.236',
-            'group_id': self.group_id
-        }
-        response = requests.get(url, params=params).json()
-        if 'error' in response:
-            raise Exception(response['error']['error_msg'])
-        else:
-            return response['response']['count']
+        return self._call('groups.getMembers', {'group_id': self.group_id})['count']
+
+    def get_stats_bulk(self, group_ids, start_date, end_date, days_per_call=30):
+        """
+        Возвращает статистику по дням для нескольких сообществ.
+
+        Диапазон дат разбивается на окна по days_per_call дней, а вызовы stats.get
+        для всех окон и сообществ упаковываются по 25 в один запрос execute.
+
+        Returns:
+            dict: {group_id: [статистика за день, ...]} по возрастанию даты
+        """
+        start = datetime.datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        end = datetime.datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+
+        return self.get_daily_stats([(group_id, start, end) for group_id in group_ids], days_per_call)
+
+    def get_daily_stats(self, ranges, days_per_call=30):
+        """
+        Возвращает статистику по дням для списка (group_id, начало, конец).
+
+        Границы задаются объектами datetime в UTC, конец не включается.
+        Окна, которые VK не вернул, пропускаются.
+        """
+        stats = {group_id: [] for group_id, _, _ in ranges}
+        for group_id, _, _, periods in self.get_daily_windows(ranges, days_per_call):
+            stats[group_id].extend(periods or [])
+        for periods in stats.values():
+            periods.sort(key=lambda period: period.get('period_from', 0))
+        return stats
+
+    def get_daily_windows(self, ranges, days_per_call=30):
+        """
+        Запрашивает статистику по дням окнами не длиннее days_per_call дней.
+
+        Returns:
+            list[tuple]: (group_id, начало окна, конец окна, периоды) для каждого
+                окна; периоды равны None, если вызов stats.get для окна не выполнен
+        """
+        calls = []
+        windows = []
+        for group_id, start, end in ranges:
+            window_start = start
+            while window_start < end:
+                window_end = min(window_start + datetime.timedelta(days=days_per_call), end)
+                calls.append(('stats.get', {
+                    'group_id': group_id,
+                    'timestamp_from': int(window_start.timestamp()),
+                    'timestamp_to': int(window_end.timestamp()),
+                    'interval': 'day',
+                    'intervals_count': (window_end - window_start).days
+                }))
+                windows.append((group_id, window_start, window_end))
+                window_start = window_end
+
+        return [
+            (group_id, window_start, window_end, None if periods is False else periods)
+            for (group_id, window_start, window_end), periods in zip(windows, self.execute(calls))
+        ]
+
+    def get_members(self, page_size=1000, max_workers=4):
+        """
+        Возвращает идентификаторы всех участников сообщества.
+
+        Первая страница даёт общее число участников, остальные страницы
+        запрашиваются пачками по 25 через execute в нескольких потоках.
+        """
+        first_page = self._call('groups.getMembers', {
+            'group_id': self.group_id,
+            'offset': 0,
+            'count': page_size
+        })
+        members = list(first_page['items'])
+        offsets = list(range(page_size, first_page['count'], page_size))
+        if not offsets:
+            return members
+
+        calls = [
+            ('groups.getMembers', {'group_id': self.group_id, 'offset': offset, 'count': page_size})
+            for offset in offsets
+        ]
+        for page in self.execute(calls, max_workers=max_workers):
+            if page:
+                members.extend(page['items'])
+        return members
+
+    def execute(self, calls, max_workers=4):
+        """
+        Выполняет список вызовов (метод, параметры) пачками по 25 через execute.
+
+        Пачки отправляются параллельно. Результаты возвращаются в порядке вызовов,
+        для неудачных вызовов (и всех вызовов неудавшейся пачки) возвращается False.
+        """
+        return execute_parallel(self._execute_batch, calls, max_workers)
+
+    def _execute_batch(self, calls):
+        return self._call('execute', {'code': execute_code(calls)}, post=True)
+
+    def _call(self, method, params, post=False):
+        return call_method(
+            self.session, self.api_url, method, params, self.vk_api_key, self.rate_limiter, self.timeout, post=post
+        )
+
+
+class AsyncVKStats:
+    """
+    Асинхронный вариант VKStats поверх AsyncVKClient.
+
+    Сборщики статистики разных сообществ могут разделять один клиент.
+    """
+
+    def __init__(self, vk_api_key, group_id, client=None, api_url=VK_API_URL):
+        self.vk_api_key = vk_api_key
+        self.group_id = group_id
+        self._owns_client = client is None
+        self.client = client or AsyncVKClient(api_url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def get_stats(self, start_date, end_date):
+        start = datetime.datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        end = datetime.datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        response = await self.client.call('stats.get', {
+            'group_id': self.group_id,
+            'timestamp_from': start.timestamp(),
+            'timestamp_to': end.timestamp()
+        }, self.vk_api_key)
+        return response[0]
+
+    async def get_followers(self):
+        response = await self.client.call('groups.getMembers', {'group_id': self.group_id}, self.vk_api_key)
+        return response['count']
+
+    async def execute(self, calls):
+        """
+        Выполняет список вызовов (метод, параметры) пачками по 25 через execute.
+        """
+        return await self.client.execute(calls, self.vk_api_key)
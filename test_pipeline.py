@@ -0,0 +1,46 @@
+# test_pipeline.py
+
+import time
+
+from generators.text_gen_ds import DeepSeekPostGenerator
+from generators.image_gen_gg import ImagenGenerator
+from pipeline.post_pipeline import PostJob, PostPipeline
+import config as conf
+
+# Инициализация генераторов
+post_gen = DeepSeekPostGenerator(
+    api_key=conf.DEEPSEEK_API_KEY,
+    tone="позитивный и весёлый",
+    topic="Новая коллекция кухонных ножей от компании ZeroKnifes"
+)
+img_gen = ImagenGenerator(
+    project_id=conf.GCP_PROJECT_ID,
+    location=conf.GCP_LOCATION,
+    gcs_bucket_name=conf.GCS_BUCKET_NAME,
+    streaming_io=True
+)
+
+# Конвейер без публикации в VK
+pipeline = PostPipeline(post_gen, img_gen)
+jobs = [
+    PostJob(topic="Новая коллекция кухонных ножей от компании ZeroKnifes", tone="позитивный и весёлый"),
+    PostJob(topic="Как правильно точить нож", tone="экспертный"),
+    PostJob(topic="Уход за деревянной разделочной доской", tone="дружелюбный"),
+]
+
+start_time = time.time()
+results = pipeline.run(jobs)
+duration = time.time() - start_time
+
+# Вывод результатов
+for result in results:
+    print(f"\nТема: {result.job.topic}")
+    if result.error:
+        print(f"❌ Ошибка: {result.error}")
+    else:
+        print(f"✅ Текст поста:\n{result.text}")
+        print(f"✅ Промпт для изображения: {result.image_prompt}")
+        print(f"✅ Размер изображения: {len(result.image)} байт")
+    print("Время этапов:", ", ".join(f"{name}={seconds:.2f} сек" for name, seconds in result.timings.items()))
+
+print(f"\nВсего: {len(results)} постов за {duration:.2f} сек")
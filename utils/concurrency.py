@@ -0,0 +1,184 @@
+# utils/concurrency.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import metrics
+from utils.rate_limiter import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+# Пределы параллелизма по провайдерам: (начальный, минимальный, максимальный).
+# Начальные значения совпадают с размерами пулов по умолчанию (generate_post_many, generate_images)
+PROVIDER_CONCURRENCY = {
+    "deepseek": (8, 1, 64),
+    "gemini": (8, 1, 32),
+    "imagen": (4, 1, 8),
+}
+DEFAULT_CONCURRENCY = (8, 1, 32)
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный ограничитель числа одновременных запросов (AIMD).
+
+    Пока задержка держится около базовой (минимальной наблюдаемой), предел
+    растёт на единицу за «окно» из limit успешных ответов. Рост задержки
+    выше tolerance × базовая уменьшает предел плавно, ошибка превышения
+    квоты (429, ResourceExhausted) — вдвое. Уменьшение выполняется не чаще
+    раза за текущую задержку, чтобы пачка одновременных 429 не обрушила
+    предел до минимума.
+    """
+
+    def __init__(self, name: str, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 tolerance: float = 2.0, backoff: float = 0.5, smoothing: float = 0.2):
+        """
+        Args:
+            name (str): Имя ограничителя (метка provider в метриках)
+            initial (int): Начальный предел
+            min_limit (int): Нижняя граница предела
+            max_limit (int): Верхняя граница предела
+            tolerance (float): Во сколько раз задержка может превысить базовую без снижения предела
+            backoff (float): Множитель предела при превышении квоты
+            smoothing (float): Коэффициент EWMA задержки
+        """
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("Должно выполняться 1 <= min_limit <= initial <= max_limit")
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self._limit = float(initial)
+        self._inflight = 0
+        self._baseline: float | None = None
+        self._latency: float | None = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        """
+        Текущий предел одновременных запросов.
+        """
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """
+        Ждёт свободного места. Возвращает False, если timeout истёк.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._inflight < int(self._limit), timeout):
+                return False
+            self._inflight += 1
+            metrics.set_gauge("postgen_concurrency_inflight", self._inflight, provider=self.name)
+            return True
+
+    def release(self, latency: float | None = None, overloaded: bool = False) -> None:
+        """
+        Освобождает место и корректирует предел.
+
+        Args:
+            latency (float | None): Задержка успешного вызова (None — не учитывать)
+            overloaded (bool): Провайдер ответил превышением квоты
+        """
+        with self._condition:
+            saturated = self._inflight >= int(self._limit)
+            self._inflight -= 1
+            if overloaded:
+                self._decrease(self.backoff, "превышение квоты")
+            elif latency is not None:
+                self._observe(latency, saturated)
+            metrics.set_gauge("postgen_concurrency_inflight", self._inflight, provider=self.name)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, track_latency: bool = True):
+        """
+        Занимает место на время вызова и учитывает его результат.
+
+        Ошибки превышения квоты снижают предел, прочие ошибки на предел
+        не влияют. Исключение пробрасывается дальше. track_latency=False
+        для потоковых ответов: их длительность зависит и от потребителя.
+        """
+        self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.release(overloaded=is_rate_limit_error(e))
+            raise
+        except BaseException:
+            # Закрытый генератор или прерывание: место освобождается без учёта задержки
+            self.release()
+            raise
+        self.release(time.perf_counter() - started if track_latency else None)
+
+    def _observe(self, latency: float, saturated: bool) -> None:
+        if self._latency is None:
+            self._latency = self._baseline = latency
+        else:
+            self._latency += self.smoothing * (latency - self._latency)
+            self._baseline = min(self._baseline, latency)
+
+        if self._latency > self.tolerance * self._baseline:
+            if self._limit <= self.min_limit:
+                # Задержка высока и при минимальной нагрузке: провайдер стал медленнее, базовая устарела
+                self._baseline = self._latency
+                return
+            self._decrease(max(self.backoff, self._baseline * self.tolerance / self._latency), "рост задержки")
+        elif saturated and self._limit < self.max_limit:
+            # Растём, только если предел действительно был исчерпан
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._publish()
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self._latency or 0.0):
+            return
+        self._last_decrease = now
+        previous = int(self._limit)
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        if int(self._limit) != previous:
+            logger.info(f"Параллелизм '{self.name}': {previous} -> {int(self._limit)} ({reason})")
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set_gauge("postgen_concurrency_limit", int(self._limit), provider=self.name)
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_concurrency_limiter(provider: str) -> AdaptiveLimiter:
+    """
+    Возвращает общий для процесса адаптивный ограничитель провайдера.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            initial, min_limit, max_limit = PROVIDER_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY)
+            limiter = AdaptiveLimiter(provider, initial, min_limit, max_limit)
+            _limiters[provider] = limiter
+        return limiter
+
+
+def configure_concurrency(provider: str, initial: int, min_limit: int = 1,
+                          max_limit: int | None = None) -> AdaptiveLimiter:
+    """
+    Переопределяет пределы параллелизма провайдера.
+    """
+    limiter = AdaptiveLimiter(provider, initial, min_limit, max_limit if max_limit is not None else max(initial, 64))
+    with _limiters_lock:
+        _limiters[provider] = limiter
+    logger.info(f"Параллелизм для '{provider}': {initial} (от {limiter.min_limit} до {limiter.max_limit})")
+    return limiter
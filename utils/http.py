@@ -0,0 +1,59 @@
+# utils/http.py
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# (таймаут соединения, таймаут чтения) в секундах
+DEFAULT_TIMEOUT = (5, 30)
+
+
+def create_session(pool_size: int = 20, max_retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    """
+    Создаёт HTTP-сессию с пулом keep-alive соединений и повторами.
+
+    Повторы выполняются только для идемпотентных методов и ошибок соединения,
+    поэтому POST (например, wall.post) не будет отправлен дважды.
+
+    Args:
+        pool_size (int): Максимальное число соединений на хост
+        max_retries (int): Максимальное число повторов
+        backoff_factor (float): Базовый множитель задержки между повторами
+
+    Returns:
+        requests.Session: Настроенная сессия
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_shared_session: requests.Session | None = None
+_shared_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Возвращает общую для процесса HTTP-сессию (создаётся при первом обращении).
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+            logger.info("Создан общий пул HTTP-соединений")
+        return _shared_session
@@ -0,0 +1,221 @@
+# utils/metrics.py
+
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности, сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_gauges: dict[tuple, float] = {}
+_histograms: dict[tuple, list] = {}
+_hooks: list[Callable[[str, str, float, dict], None]] = []
+
+
+def enable() -> None:
+    """
+    Включает сбор метрик. По умолчанию сбор выключен и почти ничего не стоит.
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def add_hook(hook: Callable[[str, str, float, dict], None]) -> None:
+    """
+    Регистрирует обработчик измерений, например мост в OpenTelemetry.
+
+    Обработчик вызывается как hook(kind, name, value, labels), где kind —
+    'counter', 'gauge' или 'histogram'.
+    """
+    _hooks.append(hook)
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """
+    Увеличивает счётчик.
+    """
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _notify("counter", name, value, labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """
+    Устанавливает текущее значение показателя.
+    """
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+    _notify("gauge", name, value, labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Добавляет наблюдение в гистограмму.
+    """
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            # [счётчики по корзинам..., сумма, количество]
+            histogram = [0] * len(DEFAULT_BUCKETS) + [0.0, 0]
+            _histograms[key] = histogram
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+    _notify("histogram", name, value, labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels, status="error" if exc_type else "ok")
+        observe(self.name, time.perf_counter() - self.started, **labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels):
+    """
+    Контекстный менеджер, записывающий длительность блока в гистограмму.
+
+    При выключенном сборе возвращает общий пустой объект без замеров.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def _notify(kind: str, name: str, value: float, labels: dict) -> None:
+    for hook in _hooks:
+        try:
+            hook(kind, name, value, labels)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика метрик: {e}")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """
+    Возвращает все метрики в текстовом формате Prometheus.
+    """
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, list(value)) for key, value in _histograms.items())
+
+    declared = set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in gauges:
+        declare(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        declare(name, "histogram")
+        for bound, count in zip(DEFAULT_BUCKETS, histogram):
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """
+    Сбрасывает все накопленные значения.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def start_http_server(port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Запускает в фоне HTTP-сервер, отдающий метрики по адресу /metrics.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    enable()
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Метрики доступны на http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,151 @@
+# utils/rate_limiter.py
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Лимиты по провайдерам: (запросов в секунду, максимальный всплеск)
+PROVIDER_LIMITS = {
+    "deepseek": (10.0, 10),
+    "gemini": (5.0, 5),
+    "imagen": (1.0, 2),
+    "vk": (3.0, 3),
+}
+DEFAULT_LIMIT = (5.0, 5)
+
+
+class TokenBucket:
+    """
+    Потокобезопасный ограничитель частоты запросов по алгоритму token bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): Скорость пополнения (токенов в секунду)
+            capacity (float): Ёмкость корзины (допустимый всплеск запросов)
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate и capacity должны быть положительными")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Забирает токены без ожидания. Возвращает False, если их недостаточно.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Блокирует поток, пока не станет доступно нужное число токенов.
+        """
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+_limiters: dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> TokenBucket:
+    """
+    Возвращает общий для процесса ограничитель провайдера.
+
+    Args:
+        provider (str): Имя провайдера ('deepseek', 'gemini', 'imagen', 'vk')
+
+    Returns:
+        TokenBucket: Ограничитель, разделяемый всеми клиентами провайдера
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, capacity = PROVIDER_LIMITS.get(provider, DEFAULT_LIMIT)
+            limiter = TokenBucket(rate, capacity)
+            _limiters[provider] = limiter
+        return limiter
+
+
+def configure_limiter(provider: str, rate: float, capacity: float | None = None) -> TokenBucket:
+    """
+    Переопределяет лимит провайдера (например, под выделенную квоту проекта).
+    """
+    limiter = TokenBucket(rate, capacity if capacity is not None else max(1.0, rate))
+    with _limiters_lock:
+        _limiters[provider] = limiter
+    logger.info(f"Лимит для '{provider}': {rate} запр/сек")
+    return limiter
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Определяет, вызвана ли ошибка превышением лимита запросов (HTTP 429).
+    """
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return "rate limit" in str(error).lower()
+
+
+def retry_after_from_error(error: Exception) -> float | None:
+    """
+    Извлекает задержку из заголовка Retry-After ответа, если он есть.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float | None = None) -> float:
+    """
+    Вычисляет задержку перед повтором: экспоненциальный рост со случайным джиттером.
+
+    Args:
+        attempt (int): Номер попытки, начиная с 0
+        base (float): Базовая задержка в секундах
+        cap (float): Верхняя граница задержки
+        retry_after (float | None): Задержка, запрошенная сервером
+
+    Returns:
+        float: Задержка в секундах
+    """
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, base)
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
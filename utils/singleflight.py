@@ -0,0 +1,70 @@
+# utils/singleflight.py
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых запросов (single-flight).
+
+    Первый вызов с ключом выполняет функцию, остальные вызовы с тем же
+    ключом, пришедшие до его завершения, ждут и получают тот же результат
+    (или то же исключение). Асинхронные пакетные методы генераторов
+    выполняют вызовы в пуле потоков, поэтому тоже проходят через do.
+    Результат не запоминается: после завершения вызова следующий запрос
+    с тем же ключом снова обращается к функции.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Имя группы (метка в метриках)
+        """
+        self.name = name
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.inc("postgen_coalesced_requests_total", group=self.name)
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполняет func(*args, **kwargs) или присоединяется к уже идущему вызову с тем же ключом.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            logger.debug(f"Запрос присоединён к выполняющемуся ({self.name})")
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        """
+        Число выполняющихся ведущих вызовов.
+        """
+        with self._lock:
+            return len(self._calls)
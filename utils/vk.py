@@ -0,0 +1,132 @@
+# utils/vk.py
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.rate_limiter import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+VK_API_URL = 'https://api.vk.com/method'
+VK_API_VERSION = '5.236'
+# Максимальное число вызовов API внутри одного execute
+EXECUTE_BATCH_SIZE = 25
+# Ограничение длины кода execute с запасом: длинные тексты постов не должны упираться в лимит запроса
+EXECUTE_MAX_CODE_LENGTH = 50000
+# Коды ошибок VK API, после которых запрос можно повторить: 6 — слишком много запросов в секунду
+VK_ERROR_TOO_MANY_REQUESTS = 6
+RETRYABLE_ERROR_CODES = frozenset({VK_ERROR_TOO_MANY_REQUESTS})
+# Число повторов вызова после ошибки из RETRYABLE_ERROR_CODES
+VK_MAX_RETRIES = 3
+
+
+class VKAPIError(Exception):
+    """
+    Ошибка, возвращённая VK API в поле error ответа.
+    """
+
+    def __init__(self, code, message, method=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.method = method
+
+    @property
+    def retryable(self):
+        return self.code in RETRYABLE_ERROR_CODES
+
+
+def unwrap_response(response, method=None):
+    """
+    Возвращает поле response ответа VK API или поднимает VKAPIError.
+    """
+    if 'error' in response:
+        error = response['error']
+        raise VKAPIError(error.get('error_code'), error.get('error_msg', str(error)), method)
+    return response['response']
+
+
+def call_method(session, api_url, method, params, access_token, rate_limiter, timeout, post=False,
+                max_retries=VK_MAX_RETRIES):
+    """
+    Вызывает метод VK API через requests-сессию и возвращает поле response.
+
+    Ошибка 6 приходит с HTTP 200, поэтому повторы urllib3 на неё не срабатывают:
+    такие вызовы повторяются здесь с экспоненциальной задержкой. post=True
+    отправляет параметры в теле запроса (длинные тексты, execute).
+
+    Raises:
+        VKAPIError: VK вернул ошибку, и повторы исчерпаны или ошибка не временная
+    """
+    params = dict(params, access_token=access_token, v=VK_API_VERSION)
+    url = f'{api_url}/{method}'
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        with metrics.timer('postgen_external_call_seconds', provider='vk', operation=method):
+            if post:
+                response = session.post(url, data=params, timeout=timeout).json()
+            else:
+                response = session.get(url, params=params, timeout=timeout).json()
+        try:
+            return unwrap_response(response, method)
+        except VKAPIError as e:
+            if not e.retryable or attempt == max_retries:
+                raise
+            wait_time = backoff_delay(attempt, base=0.5, cap=10.0)
+            logger.warning(f"VK API {method}: {e} (код {e.code}). Повтор через {wait_time:.1f} сек...")
+            metrics.inc('postgen_external_call_retries_total', provider='vk')
+            time.sleep(wait_time)
+
+
+def execute_code(calls):
+    """
+    Собирает код VKScript, возвращающий массив результатов вызовов (метод, параметры).
+    """
+    return 'return [' + ','.join(
+        f'API.{method}({json.dumps(params, ensure_ascii=False)})' for method, params in calls
+    ) + '];'
+
+
+def execute_batches(calls, max_calls=EXECUTE_BATCH_SIZE, max_code_length=EXECUTE_MAX_CODE_LENGTH):
+    """
+    Разбивает вызовы на пачки для execute с учётом числа вызовов и длины кода.
+    """
+    batches, batch, length = [], [], 0
+    for call in calls:
+        call_length = len(execute_code([call]))
+        if batch and (len(batch) == max_calls or length + call_length > max_code_length):
+            batches.append(batch)
+            batch, length = [], 0
+        batch.append(call)
+        length += call_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def execute_parallel(execute_batch, calls, max_workers=4):
+    """
+    Выполняет вызовы (метод, параметры) пачками через execute в нескольких потоках.
+
+    execute_batch(пачка) отправляет одну пачку и возвращает список результатов.
+    Результаты возвращаются в порядке вызовов. Для неудачных вызовов внутри
+    пачки возвращается False; если не выполнилась вся пачка, False получают
+    все её вызовы, а остальные пачки не теряются.
+    """
+    batches = execute_batches(calls)
+    if not batches:
+        return []
+
+    def run(batch):
+        try:
+            return execute_batch(batch)
+        except Exception as e:
+            logger.error(f'execute ({len(batch)} вызовов) не выполнен: {e}')
+            return [False] * len(batch)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        responses = list(pool.map(run, batches))
+    return [result for response in responses for result in response]
@@ -0,0 +1,140 @@
+# utils/vk_async.py
+
+import asyncio
+import logging
+import os
+
+import httpx
+
+from utils import metrics
+from utils.rate_limiter import backoff_delay, get_limiter
+from utils.vk import (
+    VK_API_URL, VK_API_VERSION, VK_MAX_RETRIES, VKAPIError, execute_batches, execute_code, unwrap_response
+)
+
+logger = logging.getLogger(__name__)
+
+# Таймауты как у синхронной сессии: 5 сек на соединение, 30 сек на остальное
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+
+class AsyncVKClient:
+    """
+    Асинхронный клиент VK API на httpx.
+
+    Клиент держит общий пул keep-alive соединений и может обслуживать
+    публикацию и статистику многих сообществ в одном цикле событий — токен
+    передаётся в каждый вызов. Ответ с ошибкой превращается в VKAPIError,
+    ошибка 6 («слишком много запросов в секунду») повторяется с задержкой.
+    Частота запросов ограничивается тем же общим лимитом 'vk', что и у
+    синхронных клиентов, но без блокировки цикла событий.
+    """
+
+    def __init__(self, api_url=VK_API_URL, version=VK_API_VERSION, timeout=DEFAULT_TIMEOUT, max_retries=VK_MAX_RETRIES,
+                 max_connections=20, http_client=None):
+        """
+        Args:
+            api_url (str): Адрес VK API
+            version (str): Версия VK API
+            timeout (httpx.Timeout | float): Таймауты запросов
+            max_retries (int): Число повторов после ошибки 6
+            max_connections (int): Размер пула соединений (пул httpcore дорожает квадратично с числом запросов в полёте)
+            http_client (httpx.AsyncClient | None): Готовый клиент (закрывает его владелец)
+        """
+        self.api_url = api_url.rstrip('/')
+        self.version = version
+        self.max_retries = max_retries
+        self._owns_http = http_client is None
+        self.http = http_client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.rate_limiter = get_limiter('vk')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._owns_http:
+            await self.http.aclose()
+
+    async def _throttle(self):
+        while not self.rate_limiter.try_acquire():
+            await asyncio.sleep(1.0 / self.rate_limiter.rate)
+
+    async def call(self, method, params, access_token, post=False):
+        """
+        Вызывает метод VK API и возвращает поле response.
+
+        post=True отправляет параметры в теле запроса (длинные тексты, execute).
+        """
+        params = dict(params, access_token=access_token, v=self.version)
+        url = f'{self.api_url}/{method}'
+        for attempt in range(self.max_retries + 1):
+            await self._throttle()
+            with metrics.timer('postgen_external_call_seconds', provider='vk', operation=method):
+                if post:
+                    response = await self.http.post(url, data=params)
+                else:
+                    response = await self.http.get(url, params=params)
+            try:
+                return unwrap_response(response.json(), method)
+            except VKAPIError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                wait_time = backoff_delay(attempt, base=0.5, cap=10.0)
+                logger.warning(f"VK API {method}: {e} (код {e.code}). Повтор через {wait_time:.1f} сек...")
+                metrics.inc('postgen_external_call_retries_total', provider='vk')
+                await asyncio.sleep(wait_time)
+
+    async def execute(self, calls, access_token):
+        """
+        Выполняет вызовы (метод, параметры) пачками через execute.
+
+        Пачки отправляются одновременно. Результаты возвращаются в порядке
+        вызовов, для неудачных вызовов внутри пачки возвращается False.
+        """
+        responses = await asyncio.gather(*(
+            self.call('execute', {'code': execute_code(batch)}, access_token, post=True)
+            for batch in execute_batches(calls)
+        ))
+        return [result for response in responses for result in response]
+
+    async def upload(self, upload_url, image):
+        """
+        Отправляет изображение на сервер загрузки VK и возвращает его ответ.
+
+        image может быть URL, путём к файлу, байтами или открытым бинарным потоком.
+        """
+        data = await self._read_image(image)
+        with metrics.timer('postgen_external_call_seconds', provider='vk', operation='upload'):
+            response = await self.http.post(upload_url, files={'photo': ('image.jpg', data, 'application/octet-stream')})
+        metrics.inc('postgen_uploaded_bytes_total', len(data), target='vk')
+        uploaded = response.json()
+        if 'error' in uploaded or not uploaded.get('photo'):
+            raise Exception(f"Сервер загрузки не принял фото: {uploaded.get('error', uploaded)}")
+        return uploaded
+
+    async def _read_image(self, image):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
+
+        if isinstance(image, str) and image.startswith(('http://', 'https://')):
+            response = await self.http.get(image)
+            response.raise_for_status()
+            return response.content
+
+        # Чтение с диска и из потоков — в пуле потоков, чтобы не блокировать цикл событий
+        if isinstance(image, (str, os.PathLike)):
+            def read_file():
+                with open(image, 'rb') as f:
+                    return f.read()
+            return await asyncio.to_thread(read_file)
+
+        if hasattr(image, 'read'):
+            return await asyncio.to_thread(image.read)
+
+        raise TypeError(f'Неподдерживаемый источник изображения: {type(image).__name__}')